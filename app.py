@@ -1,26 +1,81 @@
-from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 
-from core.flow import handle_message
+from core import metrics
+from core.flow import handle_message, stream_message, warm_up
+from core.intel_index import NORMALIZERS, indicator_index
+from core.known_bad import get_known_bad
+from core.log import get_logger
+from core.sessions import SESSION_BACKEND, sessions
+from core.reply_pool import reply_pool
+from core.scam_intent import classify_texts
+from core.workers import run_cpu
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import json
-from core.sessions import sessions
+from tools.callback import bind_event_loop, get_outbox
 from fastapi.middleware.cors import CORSMiddleware
 
+import asyncio
 import os
+import threading
 
 API_KEY = os.getenv("HONEYPOT_API_KEY")
+CLASSIFY_MAX_TEXTS = int(os.getenv("CLASSIFY_MAX_TEXTS", "10000"))
+CLASSIFY_CHUNK_SIZE = int(os.getenv("CLASSIFY_CHUNK_SIZE", "1000"))
 
 if not API_KEY:
     raise Exception("HONEYPOT_API_KEY not set")  
 
+log = get_logger("app")
+
 
 app = FastAPI(title="Agentic Honeypot API")
+
+
+@app.on_event("startup")
+async def start_background_work():
+    if sessions.journal is not None:
+        # Before serving anything, so no turn starts from an empty session.
+        sessions.journal.restore(sessions)
+        for session_id in sessions.session_ids():
+            indicator_index.add_session(sessions[session_id])
+        sessions.journal.start()
+    # Loaded in the executor before serving, so the first turns already
+    # see the filter; the refresher thread keeps it current after that.
+    known_bad = get_known_bad()
+    await run_cpu(known_bad.refresh)
+    known_bad.start()
+    # Bound first: the outbox may finish rows left by a previous process
+    # before any callback is sent from this one.
+    bind_event_loop(asyncio.get_running_loop())
+    # Drain anything left in the outbox by a previous process, and
+    # optionally load models, without holding up the first request.
+    threading.Thread(target=lambda: get_outbox().start(), name="outbox-start", daemon=True).start()
+    if os.getenv("WARMUP_ON_STARTUP") == "1":
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    if os.getenv("LLM_API_KEY"):
+        reply_pool.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_work():
+    await reply_pool.stop()
+    if sessions.journal is not None:
+        await sessions.journal.stop()
+    get_outbox().stop()
+    get_known_bad().stop()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.middleware("http")
 async def log_requests(request, call_next):
-    print("INCOMING:", request.method, request.url)
+    log.debug("incoming request", method=request.method, path=request.url.path)
     response = await call_next(request)
     return response
 @app.exception_handler(RequestValidationError)
@@ -28,13 +83,9 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     
     body = await request.body()
     
-    print("\n--- DEBUG: INCOMING FAILURE ---")
-    print(f"URL: {request.url}")
-    print(f"Body received: {body.decode('utf-8')}")
-    print("Validation Errors:")
-    
-    print(json.dumps(exc.errors(), indent=2))
-    print("-------------------------------\n")
+    # Field errors only; request bodies can be large and carry user text.
+    log.warning("request validation failed", path=request.url.path,
+                errors=[{"loc": list(e["loc"]), "type": e["type"]} for e in exc.errors()])
     
     return JSONResponse(
         status_code=422,
@@ -88,14 +139,40 @@ class HoneypotResponse(BaseModel):
         extra = "allow"
 
 
+class ClassifyRequest(BaseModel):
+    texts: List[str]
+    threshold: float = 0.5
+
+
+class ClassifyResult(BaseModel):
+    probability: float
+    isScam: bool
+
+
+class ClassifyResponse(BaseModel):
+    status: str
+    results: List[ClassifyResult]
+
+
+class Indicator(BaseModel):
+    type: str
+    value: str
+
+
+class KnownBadRequest(BaseModel):
+    indicators: List[Indicator]
+
+
+
+def history_items(payload):
+    return [(item.sender, item.text, item.timestamp) for item in payload.conversationHistory or ()]
+
 
 @app.post("/honeypot", response_model=HoneypotResponse)
-def honeypot_endpoint(
+async def honeypot_endpoint(
     payload: HoneypotRequest,
     x_api_key: str = Header(...)
 ):
-    
-    print("REQUEST RECEIVED")
 
     if x_api_key != API_KEY:
         raise HTTPException(status_code=401, detail="Invalid API Key")
@@ -104,12 +181,11 @@ def honeypot_endpoint(
     incoming_text = payload.message.text
 
 
-    reply, stop_flag = handle_message(session_id, incoming_text)
+    reply, stop_flag = await handle_message(session_id, incoming_text, history_items(payload),
+                                            payload.message.timestamp)
 
 
-    print("SESSION:", session_id)
-    print("STOP FLAG:", stop_flag)
-    print("EXTRACTED:", sessions[session_id].extracted)
+    log.debug("turn handled", session_id=session_id, stop_flag=stop_flag, replied=reply is not None)
 
 
     return {
@@ -117,7 +193,117 @@ def honeypot_endpoint(
         "reply": reply
     }
 @app.post("/honeypot/", response_model=HoneypotResponse, include_in_schema=False)
-def honeypot_slash_endpoint(
+async def honeypot_slash_endpoint(
     payload: HoneypotRequest, 
     x_api_key: str = Header(...)):
-    return honeypot_endpoint(payload, x_api_key)
\ No newline at end of file
+    return await honeypot_endpoint(payload, x_api_key)
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/honeypot/stream")
+async def honeypot_stream_endpoint(
+    payload: HoneypotRequest,
+    x_api_key: str = Header(...)
+):
+    """Same turn as /honeypot, sent as server-sent events.
+
+    ``delta`` events carry reply text as it is generated; a final ``done``
+    event carries the full reply, the stop flag and the extracted
+    intelligence so far.
+    """
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+
+    session_id = payload.sessionId
+
+    async def events():
+        async for item in stream_message(session_id, payload.message.text, history_items(payload),
+                                         payload.message.timestamp):
+            if isinstance(item, dict):
+                log.debug("turn streamed", session_id=session_id, stop_flag=item["stopFlag"],
+                          replied=item["reply"] is not None)
+                yield sse_event("done", dict(status="success", **item))
+            else:
+                yield sse_event("delta", {"text": item})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/honeypot/classify", response_model=ClassifyResponse)
+async def classify_endpoint(
+    payload: ClassifyRequest,
+    x_api_key: str = Header(...)
+):
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+
+    if len(payload.texts) > CLASSIFY_MAX_TEXTS:
+        raise HTTPException(status_code=413, detail=f"At most {CLASSIFY_MAX_TEXTS} texts per request")
+
+    # Score in fixed-size chunks so one huge request cannot hold a CPU
+    # worker for long stretches and starve /honeypot turns.
+    results = []
+    for start in range(0, len(payload.texts), CLASSIFY_CHUNK_SIZE):
+        chunk = payload.texts[start:start + CLASSIFY_CHUNK_SIZE]
+        scored = await run_cpu(classify_texts, chunk, payload.threshold)
+        results.extend({"probability": p, "isScam": is_scam} for p, is_scam in scored)
+
+    return {
+        "status": "success",
+        "results": results
+    }
+
+
+@app.get("/indicators/lookup")
+async def indicator_lookup_endpoint(
+    type: str = Query(..., description="upiIds, phoneNumbers, phishingLinks or bankAccounts"),
+    value: str = Query(...),
+    x_api_key: str = Header(...)
+):
+    """Sessions that reported an indicator, with first and last sighting (epoch seconds).
+
+    ``scope`` is "worker" with SESSION_BACKEND=sqlite, where each worker
+    only indexes the turns it handled, else "all".
+    """
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+
+    if type not in NORMALIZERS:
+        raise HTTPException(status_code=400, detail=f"type must be one of {', '.join(NORMALIZERS)}")
+
+    entry = indicator_index.lookup(type, value)
+    return {
+        "status": "success",
+        "found": entry is not None,
+        "indicator": entry,
+        "scope": "worker" if SESSION_BACKEND == "sqlite" else "all"
+    }
+
+
+@app.post("/indicators/known-bad")
+async def known_bad_endpoint(
+    payload: KnownBadRequest,
+    x_api_key: str = Header(...)
+):
+    """Add confirmed-fraudulent indicators to the known-bad filter and its file."""
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+
+    unknown = sorted({item.type for item in payload.indicators} - set(NORMALIZERS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"type must be one of {', '.join(NORMALIZERS)}")
+
+    known_bad = get_known_bad()
+    added = await run_cpu(known_bad.add, [(item.type, item.value) for item in payload.indicators])
+    return {
+        "status": "success",
+        "added": added,
+        "entries": len(known_bad.bloom)
+    }
@@ -0,0 +1,65 @@
+"""Size, speed and real false-positive rate of the known-bad Bloom filter.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_bloom [--entries 10000000] [--fp-rate 0.001] [--probes 1000000]
+
+Fills a filter sized for --entries with that many synthetic phone numbers,
+then probes it with --probes numbers that were never added. Reports the
+bit array and file size, the process RSS growth, insert and lookup times,
+and the measured false-positive rate next to the target.
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+from core.known_bad import BloomFilter, indicator_key
+
+
+def rss_mb():
+    # ru_maxrss is in KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=10_000_000)
+    parser.add_argument("--fp-rate", type=float, default=0.001)
+    parser.add_argument("--probes", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    before = rss_mb()
+    bloom = BloomFilter(args.entries, args.fp_rate)
+    start = time.perf_counter()
+    for i in range(args.entries):
+        bloom.add(f"phoneNumbers:6{i:09d}")
+    insert = time.perf_counter() - start
+    grown = rss_mb() - before
+
+    start = time.perf_counter()
+    false_positives = sum(1 for i in range(args.probes) if f"phoneNumbers:9{i:09d}" in bloom)
+    lookup = time.perf_counter() - start
+    assert indicator_key("phoneNumbers", "+91 6000000042") in bloom
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "known_bad.bloom")
+        start = time.perf_counter()
+        bloom.save(path)
+        size = os.path.getsize(path)
+        BloomFilter.load(path)
+        round_trip = time.perf_counter() - start
+
+    print(f"entries            {args.entries:,}")
+    print(f"bits / hashes      {bloom.num_bits:,} / {bloom.num_hashes}")
+    print(f"bit array          {bloom.nbytes / 1e6:.1f} MB ({bloom.nbytes * 8 / args.entries:.1f} bits per entry)")
+    print(f"file               {size / 1e6:.1f} MB, save + load {round_trip:.2f} s")
+    print(f"rss growth         {grown:.1f} MB")
+    print(f"insert             {insert / args.entries * 1e6:.2f} us per entry ({insert:.1f} s)")
+    print(f"lookup (absent)    {lookup / args.probes * 1e6:.2f} us per probe")
+    print(f"false positives    {false_positives / args.probes:.5f} (target {args.fp_rate})")
+
+
+if __name__ == "__main__":
+    main()
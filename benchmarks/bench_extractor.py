@@ -0,0 +1,116 @@
+"""Throughput of the extraction scan engine against the old per-turn extraction work.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_extractor [--messages 200] [--repeat 5]
+
+The "legacy" side reproduces what one turn used to cost: extract_all ran
+twice (flow and agent), every keyword list lowercased and searched the
+message separately, and the detector fallback did the same again. Both
+sides are checked for identical results before anything is timed.
+"""
+import argparse
+import random
+import re
+import time
+
+from core import extractor
+from core.agent import INTENT_KEYWORDS
+from core.scam_intent import FALLBACK_KEYWORDS
+
+
+TEMPLATES = [
+    "Dear customer your SBI account will be BLOCKED within 24 hours. Kindly verify KYC immediately at http://sbi-kyc-update.co.in/verify?id={n}",
+    "URGENT: Pay the pending fee of Rs {n} to refund.desk{n}@okaxis and share the OTP you receive. Call +91 98{n:08d} for help.",
+    "Your electricity connection will be disconnected tonight. Please contact officer on 9{n:09d} or visit www.bill-pay-{n}.com",
+    "Congratulations! You are the lucky winner of our lottery prize. Transfer processing charge to account 5020{n:010d} IFSC HDFC0001234",
+    "Sir did you receive the link? Click https://bit.ly/{n}x and enter your card number, expiry and password to confirm the payment.",
+]
+FILLER = (
+    "Forwarded as received. Terms and conditions apply. This is a system generated message, "
+    "do not reply. For assistance please reach our customer desk between 9am and 6pm. "
+)
+
+
+def make_corpus(count, seed=7):
+    rng = random.Random(seed)
+    corpus = []
+    for n in range(count):
+        parts = [rng.choice(TEMPLATES).format(n=rng.randint(10**7, 10**8 - 1))]
+        # Paste-heavy: the same lure pasted several times with boilerplate.
+        for _ in range(rng.randint(2, 30)):
+            parts.append(FILLER * rng.randint(1, 4))
+            parts.append(rng.choice(TEMPLATES).format(n=rng.randint(10**7, 10**8 - 1)))
+        corpus.append("\n".join(parts))
+    return corpus
+
+
+def legacy_extract_all(text):
+    phones = extractor.extract_phone(text)
+    raw_banks = extractor.extract_bank(text)
+    phone_digits_set = set(re.sub(r"\D", "", p)[-10:] for p in phones)
+    return {
+        "upiIds": extractor.extract_upi(text),
+        "phoneNumbers": phones,
+        "phishingLinks": extractor.extract_links(text),
+        "bankAccounts": [b for b in raw_banks if b not in phone_digits_set and len(b) != 10],
+        "suspiciousKeywords": extractor.extract_keywords(text),
+    }
+
+
+def legacy_turn(text):
+    extracted = legacy_extract_all(text)
+    legacy_extract_all(text)
+    msg_lower = text.lower()
+    flags = {flag: any(kw in msg_lower for kw in kws) for flag, kws in INTENT_KEYWORDS.items()}
+    fallback = sum(1 for kw in FALLBACK_KEYWORDS if kw in text.lower()) >= 2
+    return extracted, flags, fallback
+
+
+def engine_turn(text):
+    scan = extractor.scan_message.__wrapped__(text)
+    flags = {flag: scan.any(flag) for flag in INTENT_KEYWORDS}
+    fallback = scan.count("scam_fallback") >= 2
+    return scan.indicators, flags, fallback
+
+
+def check_parity(corpus):
+    for text in corpus:
+        old, new = legacy_turn(text), engine_turn(text)
+        old[0]["suspiciousKeywords"] = sorted(old[0]["suspiciousKeywords"])
+        new[0]["suspiciousKeywords"] = sorted(new[0]["suspiciousKeywords"])
+        if old != new:
+            raise SystemExit(f"Parity failure on message: {text[:80]!r}...")
+
+
+def best_time(func, corpus, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in corpus:
+            func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.messages)
+    total_mb = sum(len(t) for t in corpus) / 1e6
+    check_parity(corpus)
+
+    legacy = best_time(legacy_turn, corpus, args.repeat)
+    engine = best_time(engine_turn, corpus, args.repeat)
+
+    print(f"{len(corpus)} messages, {total_mb:.2f} MB, avg {total_mb * 1e6 / len(corpus):.0f} chars")
+    for name, seconds in (("legacy", legacy), ("engine", engine)):
+        print(f"{name:>7}: {seconds * 1e3:8.1f} ms  {len(corpus) / seconds:10.0f} msg/s  {total_mb / seconds:7.1f} MB/s")
+    print(f"speedup: {legacy / engine:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
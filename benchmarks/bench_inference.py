@@ -0,0 +1,77 @@
+"""Per-call latency of the XGBoost fast path against predict_proba.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_inference [--calls 2000]
+
+Reports p50/p99 latency per single-message call for both paths, with and
+without vectorization. That both give the same probability is checked by
+tests/test_scam_intent.py.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_extractor import TEMPLATES
+from core.scam_intent import ScamIntentDetector
+
+
+SHORT_MESSAGES = [
+    "Your account is blocked urgently verify",
+    "Send money to UPI: fraudster@upi",
+    "Payment link is http://fakebank.xyz/pay",
+    "Call me at +919876543210",
+    "hi, are we still meeting for lunch tomorrow?",
+    "Dear customer, your KYC has expired. Update now to avoid suspension.",
+    "Ok sir I will check and revert",
+]
+
+
+def make_corpus(count):
+    messages = SHORT_MESSAGES + [t.format(n=12345678) for t in TEMPLATES]
+    return [messages[i % len(messages)] for i in range(count)]
+
+
+def percentiles(func, inputs):
+    samples = []
+    for item in inputs:
+        start = time.perf_counter()
+        func(item)
+        samples.append(time.perf_counter() - start)
+    samples = np.array(samples) * 1e6
+    return np.percentile(samples, 50), np.percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    detector = ScamIntentDetector()
+    if not detector.models_loaded or detector._booster is None:
+        raise SystemExit("Models not loaded or fast path unavailable; nothing to compare")
+
+    classifier = detector.classifier
+    corpus = make_corpus(args.calls)
+
+    rows = [detector.vectorizer.transform([text]) for text in corpus]
+    cases = [
+        ("predict_proba (model only)", lambda row: classifier.predict_proba(row), rows),
+        ("inplace_predict (model only)", detector._booster_scores, rows),
+        ("vectorize + predict_proba", lambda text: classifier.predict_proba(detector.vectorizer.transform([text])), corpus),
+        ("vectorize + inplace_predict", lambda text: detector._score([text]), corpus),
+    ]
+    # Warm both paths before measuring.
+    for _, func, inputs in cases:
+        for item in inputs[:50]:
+            func(item)
+
+    print(f"{'path':<30} {'p50 us':>9} {'p99 us':>9}")
+    for name, func, inputs in cases:
+        p50, p99 = percentiles(func, inputs)
+        print(f"{name:<30} {p50:9.1f} {p99:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
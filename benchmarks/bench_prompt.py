@@ -0,0 +1,57 @@
+"""Prompt size per turn with the incremental prompt state.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_prompt [--turns 40] [--context-cache]
+
+Drives one long conversation through llm_generate against the stub client
+and prints the characters sent upstream at a few turns, next to the size the
+full-window prompt would have had. With --context-cache the persona prefix is
+served from the (stubbed) upstream cache and drops out of every request.
+"""
+import argparse
+import asyncio
+
+from benchmarks.bench_extractor import TEMPLATES
+from core import llm_agent
+from core.llm_agent import PromptState, build_user_message, llm_generate, persona_cache
+from core.sessions import HISTORY_WINDOW, SessionState
+from core.stubs import StubGenaiClient
+
+
+async def converse(turns):
+    session = SessionState("bench-prompt")
+    sizes = []
+    for turn in range(turns):
+        session.add_message("assistant", TEMPLATES[turn % len(TEMPLATES)].format(n=turn))
+        reply = await llm_generate("confused", session.messages, session=session)
+        session.add_message("user", reply)
+
+        window = PromptState()
+        window.extend(session.messages.recent(HISTORY_WINDOW))
+        sizes.append(len(build_user_message("confused", window, cached_prefix=False)))
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--context-cache", action="store_true")
+    args = parser.parse_args()
+
+    client = StubGenaiClient()
+    llm_agent.set_client(client)
+    persona_cache.enabled = args.context_cache
+
+    window_sizes = asyncio.run(converse(args.turns))
+    print(f"{'turn':>6} {'sent chars':>11} {'window chars':>13}")
+    for turn in sorted({0, 1, 4, 9, 19, args.turns - 1}):
+        if turn < args.turns:
+            print(f"{turn + 1:>6} {client.calls[turn]['chars']:>11} {window_sizes[turn]:>13}")
+    if args.context_cache:
+        print(f"persona prefix ({len(llm_agent.PERSONA_PREFIX)} chars) cached "
+              f"{client.caches_created} time(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Warm-restart time of the session journal with many live sessions.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_restore [--sessions 200000] [--turns 4] [--tail 50000]
+
+Builds an in-memory store of --sessions conversations (--turns each),
+snapshots it, journals --tail more turns on top, then times how long
+SessionJournal.restore takes to rebuild an empty store from those files.
+The rebuilt store is checked against the original before timing is
+reported.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks.bench_extractor import TEMPLATES
+from core.extractor import scan_message
+from core.flow import update_intelligence
+from core.journal import SessionJournal
+from core.log import ROOT_LOGGER
+from core.sessions import SessionStore
+
+
+def play_turn(store, session_id, rng):
+    session = store.get_session(session_id)
+    session.turns += 1
+    text = rng.choice(TEMPLATES).format(n=rng.randint(10**7, 10**8 - 1))
+    session.add_message("assistant", text)
+    update_intelligence(session, scan_message(text).indicators)
+    session.scamDetected = True
+    session.add_message("user", "sir which account? i'm scared, please explain again")
+    store.save(session)
+
+
+def fingerprint(store):
+    return {
+        session_id: (session.turns, session.messages.total, list(session.messages),
+                     session.flag_bits(), [list(v) for v in session.extracted.values()])
+        for session_id in store.session_ids()
+        for session in [store.get(session_id)]
+    }
+
+
+async def build(directory, sessions, turns, tail):
+    rng = random.Random(5)
+    journal = SessionJournal(directory, snapshot_interval=0)
+    store = SessionStore(max_sessions=sessions * 2, max_bytes=1 << 40, journal=journal)
+    journal.start()
+    for _ in range(turns):
+        for i in range(sessions):
+            play_turn(store, f"session-{i}", rng)
+    await journal.snapshot(store)
+    for _ in range(tail):
+        play_turn(store, f"session-{rng.randrange(sessions)}", rng)
+    await journal.stop()
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200000)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--tail", type=int, default=50000)
+    args = parser.parse_args()
+
+    logging.getLogger(ROOT_LOGGER).setLevel(logging.WARNING)
+    directory = tempfile.mkdtemp(prefix="journal-bench-")
+    try:
+        original = asyncio.run(build(directory, args.sessions, args.turns, args.tail))
+        sizes = {name: os.path.getsize(os.path.join(directory, name)) for name in sorted(os.listdir(directory))}
+
+        restored = SessionStore(max_sessions=args.sessions * 2, max_bytes=1 << 40)
+        start = time.perf_counter()
+        SessionJournal(directory, snapshot_interval=0).restore(restored)
+        seconds = time.perf_counter() - start
+
+        if fingerprint(restored) != fingerprint(original):
+            raise SystemExit("Restored store differs from the original")
+        for name, size in sizes.items():
+            print(f"{name:<24} {size / 1e6:8.1f} MB")
+        print(f"restored {len(restored)} sessions (+{args.tail} journaled turns) in {seconds:.2f} s "
+              f"({len(restored) / seconds:,.0f} sessions/s)")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Import-time profile of the app, to keep cold starts cheap.
+
+Run from the repository root:
+
+    python -m benchmarks.import_profile [--module app] [--top 25]
+
+Imports the module in a fresh interpreter with ``-X importtime`` and
+prints the slowest imports by cumulative and by self time. Models and the
+genai client are loaded lazily, so neither should show up here.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+
+def profile_imports(module):
+    env = dict(os.environ)
+    env.setdefault("HONEYPOT_API_KEY", "import-profile")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if result.returncode != 0:
+        tail = "\n".join(line for line in result.stderr.splitlines() if not line.startswith("import time:"))
+        raise SystemExit(f"import {module} failed:\n{tail}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # header row
+        rows.append((fields[2].strip(), self_us, cumulative_us))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    rows = profile_imports(args.module)
+    total_ms = sum(self_us for _, self_us, _ in rows) / 1000
+    print(f"import {args.module}: {total_ms:.1f} ms across {len(rows)} modules\n")
+
+    print(f"{'cumulative ms':>14}  module")
+    for name, _, cumulative_us in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f}  {name}")
+
+    print(f"\n{'self ms':>14}  module")
+    for name, self_us, _ in sorted(rows, key=lambda r: r[1], reverse=True)[:args.top]:
+        print(f"{self_us / 1000:14.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
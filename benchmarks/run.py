@@ -0,0 +1,266 @@
+"""Offline micro-benchmarks for every hot-path stage, with JSON baselines.
+
+Run from the repository root:
+
+    python -m benchmarks.run [--quick] [--only extract] [--save benchmarks/baselines/main.json]
+    python -m benchmarks.run --compare benchmarks/baselines/main.json [--tolerance 0.15]
+
+Nothing leaves the process: the LLM is core.stubs.StubGenaiClient and the
+final-result callback is core.stubs.StubCallback. Inputs are synthetic scam
+messages of three lengths (one lure, a lure with boilerplate, a paste-heavy
+forward) and sessions of several depths. Caches that would otherwise turn
+repeated inputs into lookups (the scan cache, the probability cache) are
+cleared before every round, and the predict stages clear the probability
+cache before every call.
+
+Each stage reports per-call p50, p99 and mean in microseconds. --compare
+flags stages whose p50 grew by more than --tolerance over the baseline and
+exits with status 1 if any did. Sub-10us stages are noisy with --quick;
+record and compare baselines with the default settings.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+from benchmarks.bench_extractor import FILLER, TEMPLATES
+from core import extractor, flow, llm_agent
+from core.agent import agent_decide_reply, analyze_scammer_intent, choose_goal, set_policy_seed, should_stop
+from core.flow import handle_message, update_intelligence
+from core.log import ROOT_LOGGER
+from core.scam_intent import get_detector
+from core.sessions import SessionState
+from core.stubs import StubCallback, StubGenaiClient
+from tools.callback import generate_agent_notes
+
+
+LENGTHS = ("short", "medium", "long")
+DEPTHS = (2, 10, 40)
+SCAMMER_GIVING_UP = ["ok", "hmm", "send now", "?"]
+
+# Fresh ids for every end-to-end session; old ones age out of the store.
+session_ids = itertools.count()
+
+
+def make_message(rng, length):
+    def lure():
+        return rng.choice(TEMPLATES).format(n=rng.randint(10**7, 10**8 - 1))
+
+    if length == "short":
+        return lure()
+    if length == "medium":
+        return lure() + " " + FILLER * rng.randint(1, 2)
+    parts = [lure()]
+    for _ in range(rng.randint(8, 20)):
+        parts.append(FILLER * rng.randint(1, 3))
+        parts.append(lure())
+    return "\n".join(parts)
+
+
+def make_messages(count, length, seed=11):
+    rng = random.Random(f"{seed}-{length}")
+    return [make_message(rng, length) for _ in range(count)]
+
+
+def make_conversation(depth, seed=13):
+    """Scammer messages for one session: mostly lures, some curt follow-ups."""
+    rng = random.Random(f"{seed}-{depth}")
+    return [
+        rng.choice(SCAMMER_GIVING_UP) if rng.random() < 0.25 else make_message(rng, rng.choice(("short", "medium")))
+        for _ in range(depth)
+    ]
+
+
+def build_session(conversation, session_id="bench"):
+    session = SessionState(session_id)
+    for text in conversation:
+        session.turns += 1
+        session.add_message("assistant", text)
+        update_intelligence(session, extractor.scan_message(text).indicators)
+        session.add_message("user", llm_agent.generate_dynamic_fallback("confused", []))
+        session.scamDetected = True
+    return session
+
+
+def reset_caches():
+    extractor.scan_message.cache_clear()
+    get_detector().cache.clear()
+
+
+def measure(call, inputs, rounds, before_each=None):
+    """Per-call timings; ``before_each`` runs untimed ahead of every call."""
+    samples = []
+    for _ in range(rounds):
+        reset_caches()
+        for item in inputs:
+            if before_each is not None:
+                before_each()
+            start = time.perf_counter()
+            call(item)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def measure_async(call, inputs, rounds):
+    samples = []
+
+    async def run():
+        for _ in range(rounds):
+            reset_caches()
+            for item in inputs:
+                start = time.perf_counter()
+                await call(item)
+                samples.append(time.perf_counter() - start)
+
+    asyncio.run(run())
+    return samples
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "calls": len(ordered),
+        "p50_us": round(ordered[len(ordered) // 2] * 1e6, 2),
+        "p99_us": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1e6, 2),
+        "mean_us": round(statistics.fmean(ordered) * 1e6, 2),
+    }
+
+
+def stages(messages_per_length, sessions_per_depth):
+    """Yield (name, runner) pairs; a runner takes a round count and returns samples."""
+    messages = {length: make_messages(messages_per_length, length) for length in LENGTHS}
+    conversations = {depth: make_conversation(depth) for depth in DEPTHS}
+    detector = get_detector()
+
+    for length in LENGTHS:
+        yield f"extract_all[{length}]", lambda rounds, m=messages[length]: measure(extractor.extract_all, m, rounds)
+    # Short messages come from a few templates that fold to the same cache
+    # keys, so the probability cache is emptied before every call to time
+    # the model rather than a dict lookup.
+    for length in ("short", "long"):
+        yield f"predict[{length}]", \
+            lambda rounds, m=messages[length]: measure(detector.predict, m, rounds, detector.cache.clear)
+    yield "analyze_scammer_intent[medium]", \
+        lambda rounds: measure(analyze_scammer_intent, messages["medium"], rounds)
+
+    for depth in DEPTHS:
+        conversation = conversations[depth]
+        scans = [extractor.scan_message(text).indicators for text in conversation]
+
+        def fill(scans):
+            session = SessionState("bench")
+            for indicators in scans:
+                update_intelligence(session, indicators)
+
+        yield f"update_intelligence[depth={depth}]", \
+            lambda rounds, s=scans: [t / len(s) for t in measure(fill, [s] * sessions_per_depth, rounds)]
+
+        built = [build_session(conversation) for _ in range(sessions_per_depth)]
+        yield f"should_stop[depth={depth}]", lambda rounds, b=built: measure(should_stop, b, rounds)
+        yield f"generate_agent_notes[depth={depth}]", lambda rounds, b=built: measure(generate_agent_notes, b, rounds)
+        last_scan = extractor.scan_message(conversation[-1])
+        yield f"choose_goal[depth={depth}]", \
+            lambda rounds, b=built, scan=last_scan: measure(lambda session: choose_goal(session, scan), b, rounds)
+        yield f"agent_decide_reply[depth={depth}]", \
+            lambda rounds, b=built: measure_async(agent_decide_reply, b, rounds)
+
+        def conversation_runner(rounds, conversation=conversation, depth=depth):
+            async def one_session(_):
+                session_id = f"bench-{depth}-{next(session_ids)}"
+                for text in conversation:
+                    await handle_message(session_id, text)
+
+            return [t / len(conversation) for t in
+                    measure_async(one_session, range(sessions_per_depth), rounds)]
+
+        yield f"handle_message[depth={depth}]", conversation_runner
+
+
+def run_suite(only, rounds, messages_per_length, sessions_per_depth):
+    llm_agent.set_client(StubGenaiClient())
+    llm_agent.persona_cache.enabled = False
+    callback = StubCallback()
+    flow.send_guvi_callback = callback
+    # Same goals and fallback replies on every run.
+    random.seed(0)
+    set_policy_seed(0)
+
+    # Per-turn info lines would only add noise to the report.
+    logging.getLogger(ROOT_LOGGER).setLevel(logging.WARNING)
+
+    results = {}
+    for name, runner in stages(messages_per_length, sessions_per_depth):
+        if only and not any(part in name for part in only):
+            continue
+        runner(1)
+        samples = runner(rounds)
+        results[name] = summarize(samples)
+        print(f"{name:<36} p50 {results[name]['p50_us']:>10.1f} us   "
+              f"p99 {results[name]['p99_us']:>10.1f} us   mean {results[name]['mean_us']:>10.1f} us")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"\n{'stage':<36} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name, now in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<36} {'-':>10} {now['p50_us']:>10.1f}      new")
+            continue
+        change = now["p50_us"] / before["p50_us"] - 1 if before["p50_us"] else 0.0
+        flag = ""
+        if change > tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<36} {before['p50_us']:>10.1f} {now['p50_us']:>10.1f} {change:>+7.0%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=100, help="messages per length")
+    parser.add_argument("--sessions", type=int, default=10, help="sessions per depth")
+    parser.add_argument("--quick", action="store_true", help="1 round, 20 messages, 3 sessions")
+    parser.add_argument("--only", action="append", help="run stages whose name contains this")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    if args.quick:
+        args.rounds, args.messages, args.sessions = 1, 20, 3
+
+    results = run_suite(args.only, args.rounds, args.messages, args.sessions)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "settings": {"rounds": args.rounds, "messages": args.messages, "sessions": args.sessions},
+                "results": results,
+            }, f, indent=2)
+        print(f"\nsaved {len(results)} stages to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,28 @@
-import random
-import re
-from core.llm_agent import llm_generate
-from core.extractor import extract_all
+import hashlib
+import os
+from bisect import bisect_right
+from itertools import accumulate
 
+from core.llm_agent import llm_generate, llm_stream
+from core.reply_pool import pooled_reply
+from core.extractor import MessageScan, register_keywords, scan_message
 
-def analyze_scammer_intent(last_message: str) -> dict:
-    msg_lower = last_message.lower()
+
+INTENT_KEYWORDS = {
+    "asking_to_click_link": ["click", "open", "visit", "go to", "check link", "follow link", "tap"],
+    "asking_for_info": ["your account", "your number", "your otp", "send otp", "enter", "provide", "share"],
+    "asking_confirmation": ["did you", "have you", "confirm", "verify", "done", "completed", "received"],
+    "threatening": ["urgent", "immediately", "blocked", "suspended", "close", "deactivate", "within", "hours"],
+    "requesting_action": ["please", "kindly", "request", "need to", "must", "required", "should"],
+}
+
+for _intent, _keywords in INTENT_KEYWORDS.items():
+    register_keywords(_intent, _keywords)
+
+
+def analyze_scammer_intent(last_message: str, scan: MessageScan = None) -> dict:
+    if scan is None:
+        scan = scan_message(last_message)
     
     intent = {
         "asking_to_click_link": False,
@@ -18,164 +35,210 @@ def analyze_scammer_intent(last_message: str) -> dict:
         "requesting_action": False
     }
     
-    extracted = extract_all(last_message)
+    extracted = scan.indicators
     intent["providing_link"] = len(extracted["phishingLinks"]) > 0
     intent["providing_upi"] = len(extracted["upiIds"]) > 0
     intent["providing_phone"] = len(extracted["phoneNumbers"]) > 0
     
-    link_keywords = ["click", "open", "visit", "go to", "check link", "follow link", "tap"]
-    intent["asking_to_click_link"] = any(kw in msg_lower for kw in link_keywords)
-    
-    info_keywords = ["your account", "your number", "your otp", "send otp", "enter", "provide", "share"]
-    intent["asking_for_info"] = any(kw in msg_lower for kw in info_keywords)
-    
-    confirm_keywords = ["did you", "have you", "confirm", "verify", "done", "completed", "received"]
-    intent["asking_confirmation"] = any(kw in msg_lower for kw in confirm_keywords)
-    
-    threat_keywords = ["urgent", "immediately", "blocked", "suspended", "close", "deactivate", "within", "hours"]
-    intent["threatening"] = any(kw in msg_lower for kw in threat_keywords)
-    
-    action_keywords = ["please", "kindly", "request", "need to", "must", "required", "should"]
-    intent["requesting_action"] = any(kw in msg_lower for kw in action_keywords)
+    for flag in INTENT_KEYWORDS:
+        intent[flag] = scan.any(flag)
     
     return intent
 
 
-def agent_decide_reply(session):
-    last_scammer_msg = ""
-    if len(session.messages) > 0:
-        for msg in reversed(session.messages):
-            if msg["role"] == "assistant":
-                last_scammer_msg = msg["content"]
-                break
-    
-    scammer_intent = analyze_scammer_intent(last_scammer_msg)
-    extracted = session.extracted
-    
-    has_upi = len(extracted.get("upiIds", [])) > 0
-    has_link = len(extracted.get("phishingLinks", [])) > 0
-    has_phone = len(extracted.get("phoneNumbers", [])) > 0
-    has_bank = len(extracted.get("bankAccounts", [])) > 0
-    
-    missing = []
-    if not has_link:
-        missing.append("link")
-    if not has_upi:
-        missing.append("upi")
-    if not has_phone:
-        missing.append("phone")
-    if not has_bank:
-        missing.append("bank")
-    
-    if scammer_intent["providing_upi"] and has_upi:
-        if random.random() < 0.4:
-            if "phone" in missing:
-                return llm_generate("ask_for_phone", session.messages)
-            elif "link" in missing:
-                return llm_generate("ask_for_phishing_link", session.messages)
-            elif "bank" in missing:
-                return llm_generate("ask_for_bank_account", session.messages)
-        return llm_generate("upi_not_working", session.messages)
-    
-    if scammer_intent["providing_link"] and has_link:
-        if random.random() < 0.5:
-            if "upi" in missing:
-                return llm_generate("ask_for_upi", session.messages)
-            elif "phone" in missing:
-                return llm_generate("ask_for_phone", session.messages)
-            elif "bank" in missing:
-                return llm_generate("ask_for_bank_account", session.messages)
-        return llm_generate("link_not_working", session.messages)
-    
-    if scammer_intent["providing_phone"] and has_phone:
-        if random.random() < 0.5:
-            if "link" in missing:
-                return llm_generate("ask_for_phishing_link", session.messages)
-            elif "upi" in missing:
-                return llm_generate("ask_for_upi", session.messages)
-            elif "bank" in missing:
-                return llm_generate("ask_for_bank_account", session.messages)
-        return llm_generate("phone_not_reachable", session.messages)
-    
-    if scammer_intent["asking_to_click_link"] and has_link:
-        return llm_generate("link_not_working", session.messages)
-    
-    if scammer_intent["asking_confirmation"]:
-        if len(missing) > 0 and random.random() < 0.6:
-            target = random.choice(missing)
-            if target == "link":
-                return llm_generate("ask_for_phishing_link", session.messages)
-            elif target == "upi":
-                return llm_generate("ask_for_upi", session.messages)
-            elif target == "phone":
-                return llm_generate("ask_for_phone", session.messages)
-            elif target == "bank":
-                return llm_generate("ask_for_bank_account", session.messages)
-        if random.random() < 0.7:
-            return llm_generate("stall", session.messages)
-        return llm_generate("reassure", session.messages)
-    
-    if scammer_intent["threatening"]:
-        if len(missing) > 0 and random.random() < 0.5:
-            target = random.choice(missing)
-            if target == "upi":
-                return llm_generate("ask_for_upi", session.messages)
-            elif target == "phone":
-                return llm_generate("ask_for_phone", session.messages)
-        return llm_generate("reassure", session.messages)
-    
-    if scammer_intent["asking_for_info"]:
-        if len(missing) > 0 and random.random() < 0.6:
-            target = random.choice(missing)
-            if target == "phone":
-                return llm_generate("ask_for_phone", session.messages)
-            elif target == "link":
-                return llm_generate("ask_for_phishing_link", session.messages)
-            elif target == "upi":
-                return llm_generate("ask_for_upi", session.messages)
-        return llm_generate("stall", session.messages)
-    
-    if scammer_intent["requesting_action"]:
-        if len(missing) > 0 and random.random() < 0.6:
-            target = random.choice(missing)
-            if target == "link":
-                return llm_generate("ask_for_phishing_link", session.messages)
-            elif target == "upi":
-                return llm_generate("ask_for_upi", session.messages)
-    
-    if session.turns < 3:
-        return llm_generate("stall", session.messages)
-    
-    if len(missing) > 0:
-        weights = {
-            "link": 0.35,
-            "upi": 0.30,
-            "phone": 0.20,
-            "bank": 0.15
-        }
-        
-        available_options = [(item, weights.get(item, 0.25)) for item in missing]
-        total_weight = sum(w for _, w in available_options)
-        
-        rand_val = random.random() * total_weight
-        cumulative = 0
-        for item, weight in available_options:
-            cumulative += weight
-            if rand_val <= cumulative:
-                if item == "link":
-                    return llm_generate("ask_for_phishing_link", session.messages)
-                elif item == "upi":
-                    return llm_generate("ask_for_upi", session.messages)
-                elif item == "phone":
-                    return llm_generate("ask_for_phone", session.messages)
-                elif item == "bank":
-                    return llm_generate("ask_for_bank_account", session.messages)
-                break
-    
-    if random.random() < 0.5:
-        return llm_generate("stall", session.messages)
-    
-    return llm_generate("ask_for_phishing_link", session.messages)
+async def agent_decide_reply(session, last_scan=None):
+    goal = choose_goal(session, last_scan)
+    return await generate_reply(goal, session)
+
+
+async def generate_reply(goal, session):
+    # Early turns carry almost no history, so a pre-generated reply for the
+    # goal is as good as a live one and costs no LLM round trip.
+    reply = pooled_reply(goal, session)
+    if reply is not None:
+        return reply
+    return await llm_generate(goal, session.messages, session=session)
+
+
+async def agent_stream_reply(session, last_scan=None):
+    """agent_decide_reply, yielding the reply in pieces as the LLM streams it."""
+    goal = choose_goal(session, last_scan)
+    reply = pooled_reply(goal, session)
+    if reply is not None:
+        yield reply
+        return
+    async for piece in llm_stream(goal, session.messages, session=session):
+        yield piece
+
+
+# --- Goal policy ---------------------------------------------------------------
+#
+# POLICY lists the rules in priority order. A rule applies when its intent
+# shows in the scammer's last message and, if ``needs`` is given, the
+# session already holds that indicator. The first applying rule:
+# - asks for a missing indicator with probability ``ask``. "first" takes
+#   the first missing one in ``targets`` order; "any" picks uniformly among
+#   everything missing, and a pick outside ``targets`` counts as not asking.
+# - otherwise picks from the ``otherwise`` goal weights. None means the
+#   rule does not decide and the next applying rule gets its turn.
+# Past the last rule, early turns stall; later ones ask for a missing
+# indicator by MISSING_WEIGHTS, or stall / ask for a link if none is missing.
+#
+# At import each rule is compiled against every missing-indicator bitmask,
+# so choose_goal only walks the rules and indexes by the session's mask.
+# Draws come from a keyed hash of the session id and turn number (see
+# PolicyRandom), so a session's goals replay exactly for a given
+# AGENT_POLICY_SEED.
+
+INDICATOR_GOALS = {
+    "link": "ask_for_phishing_link",
+    "upi": "ask_for_upi",
+    "phone": "ask_for_phone",
+    "bank": "ask_for_bank_account",
+}
+# Bit order of a missing mask, and the order "any" picks from.
+MISSING_ORDER = ("link", "upi", "phone", "bank")
+INDICATOR_KEYS = {"link": "phishingLinks", "upi": "upiIds", "phone": "phoneNumbers", "bank": "bankAccounts"}
+MISSING_WEIGHTS = {"link": 0.35, "upi": 0.30, "phone": 0.20, "bank": 0.15}
+EARLY_TURNS = 3
+
+POLICY = (
+    # intent                  needs    ask  pick     targets                    otherwise
+    ("providing_upi",         "upi",   0.4, "first", ("phone", "link", "bank"), {"upi_not_working": 1.0}),
+    ("providing_link",        "link",  0.5, "first", ("upi", "phone", "bank"),  {"link_not_working": 1.0}),
+    ("providing_phone",       "phone", 0.5, "first", ("link", "upi", "bank"),   {"phone_not_reachable": 1.0}),
+    ("asking_to_click_link",  "link",  0.0, "first", (),                        {"link_not_working": 1.0}),
+    ("asking_confirmation",   None,    0.6, "any",   MISSING_ORDER,             {"stall": 0.7, "reassure": 0.3}),
+    ("threatening",           None,    0.5, "any",   ("upi", "phone"),          {"reassure": 1.0}),
+    ("asking_for_info",       None,    0.6, "any",   ("phone", "link", "upi"),  {"stall": 1.0}),
+    ("requesting_action",     None,    0.6, "any",   ("link", "upi"),           None),
+)
+
+# Intents read from the scan's indicators rather than its keywords.
+_PROVIDING = {"providing_upi": "upiIds", "providing_link": "phishingLinks", "providing_phone": "phoneNumbers"}
+_MISSING_BITS = tuple((1 << bit, INDICATOR_KEYS[item]) for bit, item in enumerate(MISSING_ORDER))
+
+
+def _missing_items(mask):
+    return [item for bit, item in enumerate(MISSING_ORDER) if mask >> bit & 1]
+
+
+def _weighted(weights):
+    """``(goals, cumulative weights)`` for a draw with _pick."""
+    return tuple(weights), tuple(accumulate(weights.values()))
+
+
+def _compile_rule(intent, needs, ask, pick, targets, otherwise):
+    # Per missing mask, the goals an ask can land on; None is a pick
+    # outside ``targets``.
+    asks = []
+    for mask in range(1 << len(MISSING_ORDER)):
+        missing = _missing_items(mask)
+        if not ask:
+            choices = ()
+        elif pick == "first":
+            wanted = [target for target in targets if target in missing]
+            choices = (INDICATOR_GOALS[wanted[0]],) if wanted else ()
+        else:
+            choices = tuple(INDICATOR_GOALS[item] if item in targets else None for item in missing)
+        asks.append(choices)
+    needs_bit = 0 if needs is None else 1 << MISSING_ORDER.index(needs)
+    return (intent, _PROVIDING.get(intent), needs_bit, ask, tuple(asks),
+            None if otherwise is None else _weighted(otherwise))
+
+
+def _compile_fallback(mask):
+    missing = _missing_items(mask)
+    if not missing:
+        return _weighted({"stall": 0.5, "ask_for_phishing_link": 0.5})
+    return _weighted({INDICATOR_GOALS[item]: MISSING_WEIGHTS[item] for item in missing})
+
+
+RULES = tuple(_compile_rule(*rule) for rule in POLICY)
+# Indexed by missing mask.
+FALLBACK = tuple(_compile_fallback(mask) for mask in range(1 << len(MISSING_ORDER)))
+
+
+def set_policy_seed(seed):
+    """Seed the goal draws; the same seed replays the same goals per session and turn."""
+    global _policy_hash
+    # Keyed once here; each draw copies the keyed state instead of re-keying.
+    _policy_hash = hashlib.blake2b(key=hashlib.blake2b(str(seed).encode("utf-8"), digest_size=16).digest())
+
+
+set_policy_seed(os.getenv("AGENT_POLICY_SEED") or os.urandom(16).hex())
+
+_DRAW_BITS = 53
+_DRAW_MASK = (1 << _DRAW_BITS) - 1
+
+
+class PolicyRandom:
+    """The random()/choice() subset choose_goal uses, drawn for one session turn."""
+
+    __slots__ = ("_seed", "_bits", "_left")
+
+    def __init__(self, session):
+        self._seed = f"{session.session_id}:{session.turns}".encode("utf-8")
+        self._left = 0
+
+    def random(self):
+        # One 512-bit digest holds nine draws; choose_goal needs at most
+        # four, and turns that need none skip the hash altogether.
+        if not self._left:
+            h = _policy_hash.copy()
+            h.update(self._seed)
+            self._seed = h.digest()
+            self._bits = int.from_bytes(self._seed, "little")
+            self._left = 512 // _DRAW_BITS
+        bits = self._bits
+        self._bits = bits >> _DRAW_BITS
+        self._left -= 1
+        return (bits & _DRAW_MASK) / (1 << _DRAW_BITS)
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+
+def missing_mask(extracted):
+    mask = 0
+    for bit, key in _MISSING_BITS:
+        if not extracted[key]:
+            mask |= bit
+    return mask
+
+
+def _pick(table, rng):
+    goals, cumulative = table
+    if len(goals) == 1:
+        return goals[0]
+    return goals[bisect_right(cumulative, rng.random() * cumulative[-1], 0, len(goals) - 1)]
+
+
+def choose_goal(session, last_scan=None):
+    # last_scan is the scan of the scammer's latest message, already
+    # computed by handle_message; pass it through instead of scanning the
+    # same text again.
+    if last_scan is None:
+        last_scan = scan_message(session.messages.last_content("assistant"))
+    rng = PolicyRandom(session)
+    missing = missing_mask(session.extracted)
+
+    for intent, indicator_key, needs_bit, ask, asks, otherwise in RULES:
+        if missing & needs_bit:
+            continue
+        if not (last_scan.indicators[indicator_key] if indicator_key else last_scan.any(intent)):
+            continue
+        choices = asks[missing]
+        if choices and rng.random() < ask:
+            goal = choices[0] if len(choices) == 1 else rng.choice(choices)
+            if goal is not None:
+                return goal
+        if otherwise is not None:
+            return _pick(otherwise, rng)
+
+    if session.turns < EARLY_TURNS:
+        return "stall"
+    return _pick(FALLBACK[missing], rng)
 
 
 def should_stop(session):
@@ -193,7 +256,7 @@ def should_stop(session):
     
     if len(session.messages) >= 6:
         recent_scammer_msgs = [
-            msg["content"] for msg in session.messages[-6:] 
+            msg["content"] for msg in session.messages.recent(6)
             if msg["role"] == "assistant"
         ]
         if len(recent_scammer_msgs) >= 3:
@@ -1,20 +1,26 @@
 import re
+import threading
+from functools import lru_cache
+
+from core import metrics
+
+UPI_PATTERN = r"[a-zA-Z0-9.\-_]{2,}@[a-zA-Z]{2,}"
+PHONE_PATTERN = r"(?<!\d)(?:\+91[-\s]?)?[6-9]\d{9}(?!\d)"
+LINK_PATTERN = r"(https?://[^\s]+|www\.[^\s]+|\b[a-zA-Z0-9-]+\.(?:com|in|net|org|co\.in)\b)"
+BANK_PATTERN = r"\b\d{9,18}\b"
+
 
 def extract_upi(text):
-    pattern = r"[a-zA-Z0-9.\-_]{2,}@[a-zA-Z]{2,}"
-    return re.findall(pattern, text)
+    return re.findall(UPI_PATTERN, text)
 
 def extract_phone(text):
-    pattern = r"(?<!\d)(?:\+91[-\s]?)?[6-9]\d{9}(?!\d)"
-    return re.findall(pattern, text)
+    return re.findall(PHONE_PATTERN, text)
 
 def extract_links(text):
-    pattern = r"(https?://[^\s]+|www\.[^\s]+|\b[a-zA-Z0-9-]+\.(?:com|in|net|org|co\.in)\b)"
-    return re.findall(pattern, text)
+    return re.findall(LINK_PATTERN, text)
 
 def extract_bank(text):
-    pattern = r"\b\d{9,18}\b"
-    return re.findall(pattern, text)
+    return re.findall(BANK_PATTERN, text)
 
 SCAM_KEYWORDS = ["urgent", "verify", "blocked", "suspended", "click", "otp"]
 def extract_keywords(text):
@@ -24,23 +30,107 @@ def extract_keywords(text):
             found.append(k)
     return list(set(found)) 
 
-def extract_all(text):
-    
-    phones = extract_phone(text)
-    raw_banks = extract_bank(text)
-    
+
+# --- Scan engine -------------------------------------------------------------
+#
+# One turn used to run extract_all twice and lowercase the message once per
+# keyword, per keyword list. The engine scans each message once per turn:
+# every indicator pattern is precompiled and skipped outright when the
+# characters it needs are absent, and every registered keyword list is
+# merged into one deduplicated table checked against a single lowercased
+# copy of the text. Merging the patterns into one alternation with named
+# groups, or the keywords into one trie regex, measured slower under
+# CPython's re (it loses the per-pattern literal prefix search), so the
+# per-pattern scans are kept; results are identical to the functions above.
+
+_UPI_RE = re.compile(UPI_PATTERN)
+_PHONE_RE = re.compile(PHONE_PATTERN)
+_LINK_RE = re.compile(LINK_PATTERN)
+_BANK_RE = re.compile(BANK_PATTERN)
+# Phones need 10 consecutive digits and bank accounts at least 9.
+_DIGIT_RUN_RE = re.compile(r"\d{9}")
+
+_KEYWORD_GROUPS = {}
+_keyword_lock = threading.Lock()
+_keyword_table = ()
+
+
+def register_keywords(group, keywords):
+    """Add a keyword list to the shared keyword table under ``group``."""
+    global _keyword_table
+    with _keyword_lock:
+        _KEYWORD_GROUPS[group] = tuple(k.lower() for k in keywords)
+        _keyword_table = tuple(sorted({k for words in _KEYWORD_GROUPS.values() for k in words}))
+    scan_message.cache_clear()
+
+
+class MessageScan:
+    """Everything the pipeline needs from one message, computed in one pass."""
+
+    __slots__ = ("indicators", "keywords")
+
+    def __init__(self, indicators, keywords):
+        self.indicators = indicators
+        self.keywords = keywords
+
+    def matches(self, group):
+        return [k for k in _KEYWORD_GROUPS[group] if k in self.keywords]
+
+    def any(self, group):
+        return not self.keywords.isdisjoint(_KEYWORD_GROUPS[group])
+
+    def count(self, group):
+        return sum(1 for k in _KEYWORD_GROUPS[group] if k in self.keywords)
+
+
+def _scan_indicators(text):
+    has_digits = _DIGIT_RUN_RE.search(text) is not None
+    return {
+        "upiIds": _UPI_RE.findall(text) if "@" in text else [],
+        "phoneNumbers": _PHONE_RE.findall(text) if has_digits else [],
+        "phishingLinks": _LINK_RE.findall(text),
+        "bankAccounts": _BANK_RE.findall(text) if has_digits else [],
+    }
+
+
+def _scan_keywords(text):
+    lowered = text.lower()
+    return frozenset(k for k in _keyword_table if k in lowered)
+
+
+@lru_cache(maxsize=256)
+def scan_message(text):
+    """Scan ``text`` once; cached so every stage of a turn shares the result."""
+    indicators = _scan_indicators(text)
+
+    phones = indicators["phoneNumbers"]
     phone_digits_set = set(re.sub(r"\D", "", p)[-10:] for p in phones)
+    indicators["bankAccounts"] = [
+        bank for bank in indicators["bankAccounts"]
+        if bank not in phone_digits_set and len(bank) != 10
+    ]
+
+    keywords = _scan_keywords(text)
+    indicators["suspiciousKeywords"] = [k for k in SCAM_KEYWORDS if k in keywords]
+    return MessageScan(indicators, keywords)
+
 
+metrics.collect(
+    "honeypot_scan_cache_total", "scan_message lookups by result",
+    lambda: {"hit": scan_message.cache_info().hits, "miss": scan_message.cache_info().misses},
+    labelnames=("result",)
+)
 
-    clean_banks = []
-    for bank in raw_banks:
-        if bank not in phone_digits_set and len(bank) != 10:
-            clean_banks.append(bank)
 
+register_keywords("scam", SCAM_KEYWORDS)
+
+
+def extract_all(text):
+    indicators = scan_message(text).indicators
     return {
-        "upiIds": extract_upi(text),
-        "phoneNumbers": phones,
-        "phishingLinks": extract_links(text),
-        "bankAccounts": clean_banks, 
-        "suspiciousKeywords": extract_keywords(text)
-}
\ No newline at end of file
+        "upiIds": list(indicators["upiIds"]),
+        "phoneNumbers": list(indicators["phoneNumbers"]),
+        "phishingLinks": list(indicators["phishingLinks"]),
+        "bankAccounts": list(indicators["bankAccounts"]),
+        "suspiciousKeywords": list(indicators["suspiciousKeywords"])
+}
@@ -1,55 +1,232 @@
-from core.extractor import extract_all
-from core.sessions import get_session
-from core.agent import agent_decide_reply, should_stop
-from core.scam_intent import detect_scam_intent
+from core.extractor import scan_message
+from core.sessions import sessions
+from core.agent import agent_decide_reply, agent_stream_reply, should_stop
+from core.llm_agent import get_client
+from core.intel_index import indicator_index
+from core.known_bad import KNOWN_BAD_HITS, get_known_bad
+from core.log import get_logger
+from core.metrics import STAGE_SECONDS, TURNS
+from core.scam_intent import detect_scam_intent_async, get_detector
+from core.workers import run_cpu
 from tools.callback import send_guvi_callback
+import time
+
+
+log = get_logger("flow")
+
+# conversationHistory sender of the other party; anything else is our agent.
+SCAMMER_SENDER = "scammer"
+
+
+def warm_up():
+    """Load the scam models and the LLM client ahead of the first request."""
+    get_detector().predict_many(["warm up"])
+    get_client()
+    log.info("warm-up complete")
 
 
 def update_intelligence(session, extracted):
+    """Merge ``extracted`` into the session and the cross-session index.
+
+    Returns the ``(key, item)`` pairs that were new to the session.
+    """
+    added = []
     for key in session.extracted:
         for item in extracted[key]:
-            if item not in session.extracted[key]:
-                session.extracted[key].append(item)
+            if session.add_indicator(key, item):
+                added.append((key, item))
+    if added:
+        now = time.time()
+        session.note_intel(now)
+        indicator_index.add(session.session_id, added, now)
+    return added
 
 
-def handle_message(session_id, message_text):
-    if not session_id or not message_text:
-        print("ERROR: session_id and message_text are required")
-        return None, False
+def flush_evicted_session(session):
+    # The store is dropping a finished session; make sure its result is
+    # in the durable outbox before the in-memory state goes away.
+    if session.scamDetected and not session.callback_queued:
+        log.info("session evicted before callback, queueing result", session_id=session.session_id)
+        send_guvi_callback(session)
+
+
+sessions.on_evict = flush_evicted_session
+
+
+def _scan_history(texts, detect):
+    """Scan ``texts`` and, if ``detect``, score them as one batch; returns (scans, any_scam)."""
+    scans = [scan_message(text) for text in texts]
+    return scans, detect and any(get_detector().predict_many(texts))
+
+
+async def ingest_history(session, history, before=None):
+    """Take in the conversationHistory items the session has not seen yet.
+
+    ``history`` holds ``(sender, text, timestamp)`` tuples. Scammer messages
+    newer than ``session.history_ts`` are added together with the agent
+    replies that follow them. Replies to messages the session already had
+    were recorded when they were sent. Items at or after ``before`` (the
+    live message's timestamp) are left to the live turn.
+
+    The new scammer messages are scanned and scored in one batched call, so
+    a 40-message history costs one pass instead of 40 turns.
+    """
+    if session.messages.total and not session.history_ts:
+        # Built without timestamps; there is no way to tell what is new.
+        return
+    fresh = session.messages.total == 0
+    new = []
+    taking = fresh
+    for sender, text, timestamp in sorted(history, key=lambda item: item[2]):
+        if not text or (before is not None and timestamp >= before):
+            continue
+        if sender == SCAMMER_SENDER:
+            taking = timestamp > session.history_ts
+        if taking:
+            new.append((sender == SCAMMER_SENDER, text, timestamp))
+    if not new:
+        return
+
+    texts = [text for from_scammer, text, _ in new if from_scammer]
+    scans, detected = [], False
+    if texts:
+        scans, detected = await run_cpu(_scan_history, texts, not session.scamDetected)
+
+    scans = iter(scans)
+    for from_scammer, text, timestamp in new:
+        if from_scammer:
+            session.turns += 1
+            session.add_message("assistant", text)
+            update_intelligence(session, next(scans).indicators)
+            session.history_ts = max(session.history_ts, timestamp)
+        else:
+            session.add_message("user", text)
+    if detected:
+        session.scamDetected = True
+    log.info("session rebuilt from conversation history", session_id=session.session_id,
+             messages=len(new), fresh=fresh, scam_detected=session.scamDetected)
+
+
+async def begin_turn(session_id, message_text, history=None, timestamp=None):
+    """Record the scammer's message and update detection and intelligence.
 
-    session = get_session(session_id)
+    ``history`` and ``timestamp`` come from the request; history the session
+    is missing is taken in first (see ingest_history).
+    Returns ``(session, scan)`` when the agent should reply, else None.
+    """
+    session = await sessions.get_session_async(session_id)
+
+    if history:
+        with STAGE_SECONDS.time(stage="history"):
+            await ingest_history(session, history, before=timestamp)
 
     session.turns += 1
-    session.messages.append({
-        "role": "assistant",
-        "content": message_text
-    })
+    session.add_message("assistant", message_text)
+    if timestamp is not None:
+        session.history_ts = max(session.history_ts, timestamp)
     
-    if not session.scamDetected and detect_scam_intent(message_text):
-        session.scamDetected = True
-        print(f"[SESSION {session_id}] SCAM INTENT DETECTED - Agent activated")
+    with STAGE_SECONDS.time(stage="extraction"):
+        scan = await run_cpu(scan_message, message_text)
+        update_intelligence(session, scan.indicators)
 
-    extracted = extract_all(message_text)
-    update_intelligence(session, extracted)
+    if not session.scamDetected:
+        # An indicator already confirmed as fraudulent settles it; the
+        # model only runs when none is present.
+        known = get_known_bad().match(scan.indicators)
+        if known is not None:
+            session.scamDetected = True
+            KNOWN_BAD_HITS.inc()
+            log.info("known-bad indicator, agent activated", session_id=session_id, indicator_type=known[0])
+        else:
+            with STAGE_SECONDS.time(stage="detection"):
+                detected = await detect_scam_intent_async(message_text)
+            if detected:
+                session.scamDetected = True
+                log.info("scam intent detected, agent activated", session_id=session_id)
 
     if not session.scamDetected:
-        print(f"[SESSION {session_id}] No scam detected yet - Agent not engaged")
-        return None, False
+        log.debug("no scam detected yet, agent not engaged", session_id=session_id)
+        TURNS.inc(outcome="not_engaged")
+        # save may return a merged copy instead of ``session`` (see
+        # SqliteSessionStore.save); callers read the session back from the store.
+        with STAGE_SECONDS.time(stage="store"):
+            await sessions.save_async(session)
+        return None
+
+    return session, scan
+
 
-    reply = agent_decide_reply(session)
-    session.messages.append({
-        "role": "user",
-        "content": reply
-    })
-    print("SESSION STATE:", session.extracted)
+async def finish_turn(session, reply):
+    """Record the agent's reply, queue the callback once the chat is done, and store the session.
+
+    Returns ``(session, stop_flag)``, where ``session`` is the stored state:
+    with SESSION_BACKEND=sqlite that is a merged copy if another worker
+    saved the session during this turn.
+    """
+    session.add_message("user", reply)
+    log.debug("session state", session_id=session.session_id,
+              indicators={key: len(items) for key, items in session.extracted.items()})
     
     stop_flag = should_stop(session)
+    if stop_flag:
+        session.finished = True
 
     if (
         stop_flag
         and session.scamDetected
-        and not session.callback_sent
+        and not session.callback_queued
     ):
-        send_guvi_callback(session)
+        with STAGE_SECONDS.time(stage="callback"):
+            send_guvi_callback(session)
+
+    TURNS.inc(outcome="finished" if stop_flag else "replied")
+    with STAGE_SECONDS.time(stage="store"):
+        session = await sessions.save_async(session)
+    return session, stop_flag
+
+
+async def handle_message(session_id, message_text, history=None, timestamp=None):
+    if not session_id or not message_text:
+        log.warning("session_id and message_text are required")
+        return None, False
+
+    with STAGE_SECONDS.time(stage="turn"):
+        engaged = await begin_turn(session_id, message_text, history, timestamp)
+        if engaged is None:
+            return None, False
+        session, scan = engaged
+
+        with STAGE_SECONDS.time(stage="agent"):
+            reply = await agent_decide_reply(session, scan)
+        _, stop_flag = await finish_turn(session, reply)
+        return reply, stop_flag
+
+
+async def stream_message(session_id, message_text, history=None, timestamp=None):
+    """handle_message for streaming: yields reply pieces as they arrive.
+
+    The last item is always a dict with the full ``reply`` (None when the
+    agent is not engaged), ``stopFlag`` and ``extractedIntelligence``.
+    """
+    if not session_id or not message_text:
+        log.warning("session_id and message_text are required")
+        yield {"reply": None, "stopFlag": False, "extractedIntelligence": {}}
+        return
+
+    engaged = await begin_turn(session_id, message_text, history, timestamp)
+    if engaged is None:
+        session = await sessions.get_async(session_id)
+        yield {"reply": None, "stopFlag": False,
+               "extractedIntelligence": session.extracted if session is not None else {}}
+        return
+    session, scan = engaged
+
+    pieces = []
+    with STAGE_SECONDS.time(stage="agent"):
+        async for piece in agent_stream_reply(session, scan):
+            pieces.append(piece)
+            yield piece
+    reply = "".join(pieces).strip()
 
-    return reply, stop_flag
+    session, stop_flag = await finish_turn(session, reply)
+    yield {"reply": reply, "stopFlag": stop_flag, "extractedIntelligence": session.extracted}
@@ -0,0 +1,187 @@
+"""Cross-session inverted index of extracted indicators.
+
+Maps a normalized indicator to the sessions that reported it, plus when
+it was first and last seen. A repeat-scammer lookup is then one dict get
+instead of a scan over every session's lists. update_intelligence feeds
+it with each turn's new indicators.
+
+Normalization, so trivially different spellings share an entry:
+- UPI IDs are lowercased.
+- Phone numbers keep their last 10 digits.
+- Bank accounts keep only their digits.
+- Links are reduced to their host, lowercased and without "www." and the
+  port. For URL shorteners the path is kept, because there the path is
+  the campaign.
+
+Suspicious keywords are not indexed.
+
+The index is per process: with SESSION_BACKEND=sqlite each uvicorn worker
+only indexes the turns it handled itself, and /indicators/lookup says so.
+Past INDICATOR_INDEX_MAX entries the least
+recently seen are dropped. Each entry lists at most
+INDICATOR_INDEX_MAX_SESSIONS session ids but counts all of them.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from core import metrics
+
+
+INDICATOR_INDEX_MAX = int(os.getenv("INDICATOR_INDEX_MAX", "1000000"))
+INDICATOR_INDEX_MAX_SESSIONS = int(os.getenv("INDICATOR_INDEX_MAX_SESSIONS", "100"))
+
+SHORTENER_HOSTS = frozenset({
+    "bit.ly", "tinyurl.com", "t.co", "goo.gl", "is.gd", "cutt.ly", "rb.gy", "shorturl.at", "tiny.cc", "ow.ly",
+})
+
+_NON_DIGITS_RE = re.compile(r"\D")
+_SCHEME_RE = re.compile(r"^[a-z][a-z0-9+.-]*://")
+
+
+def _normalize_phone(value):
+    digits = _NON_DIGITS_RE.sub("", value)
+    return digits[-10:] if len(digits) >= 10 else None
+
+
+def _normalize_bank(value):
+    return _NON_DIGITS_RE.sub("", value) or None
+
+
+def _normalize_upi(value):
+    return value.strip().lower() or None
+
+
+def _normalize_link(value):
+    link = _SCHEME_RE.sub("", value.strip().lower())
+    host, _, path = link.partition("/")
+    host = host.rsplit("@", 1)[-1].split(":", 1)[0].rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    if not host:
+        return None
+    path = path.split("?", 1)[0].split("#", 1)[0].strip("/")
+    if host in SHORTENER_HOSTS and path:
+        return f"{host}/{path}"
+    return host
+
+
+# Indicator lists of SessionState.extracted that are indexed, with their
+# normalizers.
+NORMALIZERS = {
+    "upiIds": _normalize_upi,
+    "phoneNumbers": _normalize_phone,
+    "bankAccounts": _normalize_bank,
+    "phishingLinks": _normalize_link,
+}
+
+
+def normalize(kind, value):
+    """Index form of ``value``, or None when it has none (or ``kind`` is not indexed)."""
+    normalizer = NORMALIZERS.get(kind)
+    return normalizer(value) if normalizer is not None else None
+
+
+class IndicatorEntry:
+    __slots__ = ("sessions", "session_count", "first_seen", "last_seen")
+
+    def __init__(self, now):
+        self.sessions = []
+        self.session_count = 0
+        self.first_seen = now
+        self.last_seen = now
+
+    def as_dict(self):
+        return {
+            "sessionCount": self.session_count,
+            "sessions": list(self.sessions),
+            "firstSeen": self.first_seen,
+            "lastSeen": self.last_seen,
+        }
+
+
+class IndicatorIndex:
+    """Normalized indicator -> IndicatorEntry, in least-recently-seen order."""
+
+    def __init__(self, max_entries=INDICATOR_INDEX_MAX, max_sessions=INDICATOR_INDEX_MAX_SESSIONS):
+        self.max_entries = max_entries
+        self.max_sessions = max_sessions
+        self.evictions = 0
+        # Keyed by "kind:normalized value"; one string is far smaller than a tuple of two.
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, session_id, pairs, now=None, first_seen=None):
+        """Record ``(kind, item)`` pairs a session has just reported for the first time.
+
+        ``now`` is when they were seen; ``first_seen``, if earlier, is used
+        for entries this creates, e.g. when re-indexing a restored session.
+        """
+        now = time.time() if now is None else now
+        first_seen = now if first_seen is None else first_seen
+        with self._lock:
+            for kind, item in pairs:
+                value = normalize(kind, item)
+                if value is None:
+                    continue
+                key = f"{kind}:{value}"
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._entries[key] = IndicatorEntry(first_seen)
+                    entry.last_seen = now
+                else:
+                    self._entries.move_to_end(key)
+                    entry.first_seen = min(entry.first_seen, first_seen)
+                    entry.last_seen = max(entry.last_seen, now)
+                    if session_id in entry.sessions:
+                        # A second spelling of the same indicator.
+                        continue
+                entry.session_count += 1
+                if len(entry.sessions) < self.max_sessions:
+                    entry.sessions.append(session_id)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def add_session(self, session, now=None):
+        """Index everything a session holds, e.g. after it was restored from disk.
+
+        Sightings are dated by the session's own first and last indicator
+        turns when it recorded them, else by ``now``.
+        """
+        first_seen = None
+        if session.intel_last_seen:
+            first_seen, now = session.intel_first_seen, session.intel_last_seen
+        self.add(session.session_id,
+                 [(kind, item) for kind in NORMALIZERS for item in session.extracted[kind]], now, first_seen)
+
+    def lookup(self, kind, value):
+        """The entry for ``value`` as a dict, or None if it has not been seen."""
+        normalized = normalize(kind, value)
+        if normalized is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(f"{kind}:{normalized}")
+            return None if entry is None else dict(entry.as_dict(), type=kind, value=normalized)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+indicator_index = IndicatorIndex()
+
+metrics.collect(
+    "honeypot_indicator_index_entries", "Distinct normalized indicators in the cross-session index",
+    lambda: {(): len(indicator_index)}, kind="gauge"
+)
+metrics.collect(
+    "honeypot_indicator_index_evictions_total", "Indicators dropped from the index to stay within its size limit",
+    lambda: {(): indicator_index.evictions}
+)
@@ -0,0 +1,298 @@
+"""Write-ahead journal and snapshots for the in-memory session store.
+
+Enabled with SESSION_JOURNAL_DIR. Every save of a session appends one
+delta record to the current journal segment. The record holds the turn's
+new messages, its new indicators, and the counters and flags as absolute
+values. A flusher thread group-commits whatever has accumulated, with one
+write and one fsync every JOURNAL_FSYNC_INTERVAL seconds. A crash loses
+at most that window.
+
+Every JOURNAL_SNAPSHOT_INTERVAL seconds a snapshot task does the following:
+- starts a new segment
+- writes every live session in compact form
+- deletes the segments and snapshots that are now covered
+
+Sessions are serialized on the event loop in small chunks, so each one is
+consistent and no turn waits long. A session that changes while the
+snapshot runs can be in both the snapshot and the new segment. Replaying a
+delta twice is harmless (SessionState.apply_delta), so that overlap is
+fine.
+
+On startup ``restore`` loads the newest complete snapshot and replays the
+segments after it.
+
+Files in the directory:
+- journal-<seq>.log: newline-delimited JSON deltas, plus ``[id, null]``
+  tombstones for evicted sessions
+- snapshot-<seq>.bin: length-prefixed zlib frames, each holding
+  length-prefixed SessionState records. Together they cover everything
+  before journal-<seq>.log
+"""
+import asyncio
+import gc
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+from core import metrics
+from core.log import get_logger
+from core.sessions import SessionState
+
+
+JOURNAL_FSYNC_INTERVAL = float(os.getenv("JOURNAL_FSYNC_INTERVAL", "0.05"))
+JOURNAL_SNAPSHOT_INTERVAL = float(os.getenv("JOURNAL_SNAPSHOT_INTERVAL", "300"))
+JOURNAL_SNAPSHOT_CHUNK = 2000
+
+log = get_logger("journal")
+
+JOURNAL_RECORDS = metrics.counter("honeypot_journal_records_total", "Session deltas appended to the journal")
+JOURNAL_FLUSH_SECONDS = metrics.histogram(
+    "honeypot_journal_flush_seconds", "Seconds per journal group commit (write plus fsync)"
+)
+
+_LENGTH = struct.Struct(">I")
+
+
+def _frames(data):
+    """Split a run of length-prefixed byte strings."""
+    offset = 0
+    while offset < len(data):
+        (length,) = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        yield data[offset:offset + length]
+        offset += length
+
+
+def _segment_name(seq):
+    return f"journal-{seq:08d}.log"
+
+
+def _snapshot_name(seq):
+    return f"snapshot-{seq:08d}.bin"
+
+
+def _seq_of(name):
+    return int(name.split("-", 1)[1].split(".", 1)[0])
+
+
+class SessionJournal:
+    def __init__(self, directory, fsync_interval=JOURNAL_FSYNC_INTERVAL,
+                 snapshot_interval=JOURNAL_SNAPSHOT_INTERVAL):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.snapshot_interval = snapshot_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self._pending = []
+        # _lock guards _pending and is only ever held briefly, so appends
+        # never wait on disk. _io_lock orders writes, fsyncs and rotation.
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._flusher = None
+        self._snapshot_task = None
+
+        # Always a fresh segment: the last one may end in a torn record,
+        # and appending to it would glue the next record onto that.
+        segments = self._files("journal-")
+        self.seq = _seq_of(segments[-1]) + 1 if segments else 1
+        self._fd = self._open_segment(self.seq)
+
+    def _files(self, prefix):
+        return sorted(name for name in os.listdir(self.directory) if name.startswith(prefix))
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _open_segment(self, seq):
+        return os.open(self._path(_segment_name(seq)), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    # Request path: only ever appends to an in-memory list.
+
+    def append(self, delta):
+        line = json.dumps(delta, separators=(",", ":"), ensure_ascii=False) + "\n"
+        with self._lock:
+            self._pending.append(line)
+        JOURNAL_RECORDS.inc()
+
+    def forget(self, session_id):
+        with self._lock:
+            self._pending.append(json.dumps([session_id, None]) + "\n")
+
+    # Background work.
+
+    def start(self):
+        """Start the flusher thread and, on the running loop, the snapshot task."""
+        if self._flusher is None:
+            self._stopping.clear()
+            self._flusher = threading.Thread(target=self._run_flusher, name="session-journal", daemon=True)
+            self._flusher.start()
+        if self._snapshot_task is None and self.snapshot_interval > 0:
+            self._snapshot_task = asyncio.get_running_loop().create_task(self._snapshot_loop())
+
+    async def stop(self):
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            try:
+                await self._snapshot_task
+            except asyncio.CancelledError:
+                pass
+            self._snapshot_task = None
+        if self._flusher is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            self._flusher.join(5.0)
+            self._flusher = None
+        self.flush()
+
+    def _run_flusher(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.fsync_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except OSError:
+                log.exception("journal flush failed")
+
+    def flush(self):
+        with self._io_lock:
+            with self._lock:
+                lines, self._pending = self._pending, []
+            if not lines:
+                return
+            start = time.perf_counter()
+            os.write(self._fd, "".join(lines).encode("utf-8"))
+            os.fsync(self._fd)
+        JOURNAL_FLUSH_SECONDS.observe(time.perf_counter() - start)
+
+    def _rotate(self):
+        """Flush, then direct further appends to a new segment; return its seq."""
+        with self._io_lock:
+            with self._lock:
+                lines, self._pending = self._pending, []
+            if lines:
+                os.write(self._fd, "".join(lines).encode("utf-8"))
+            os.fsync(self._fd)
+            os.close(self._fd)
+            self.seq += 1
+            self._fd = self._open_segment(self.seq)
+            return self.seq
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await self.snapshot()
+            except Exception:
+                log.exception("session snapshot failed")
+
+    async def snapshot(self, store=None):
+        """Write a snapshot of ``store`` and drop the files it supersedes."""
+        if store is None:
+            from core.sessions import sessions as store
+        loop = asyncio.get_running_loop()
+        seq = await loop.run_in_executor(None, self._rotate)
+        started = time.monotonic()
+
+        chunks = []
+        ids = store.session_ids()
+        for i in range(0, len(ids), JOURNAL_SNAPSHOT_CHUNK):
+            parts = []
+            for session_id in ids[i:i + JOURNAL_SNAPSHOT_CHUNK]:
+                session = store.get(session_id)
+                if session is not None:
+                    record = session.to_record(compress=False)
+                    parts.append(_LENGTH.pack(len(record)))
+                    parts.append(record)
+            chunks.append(b"".join(parts))
+            # Let turns run between chunks.
+            await asyncio.sleep(0)
+
+        await loop.run_in_executor(None, self._write_snapshot, seq, chunks)
+        log.info("session snapshot written", seq=seq, sessions=len(ids),
+                 seconds=round(time.monotonic() - started, 3))
+
+    def _write_snapshot(self, seq, chunks):
+        final = self._path(_snapshot_name(seq))
+        tmp = final + ".tmp"
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                # One zlib frame per chunk: better ratio than per-record
+                # compression and far fewer decompress calls on restore.
+                frame = zlib.compress(chunk, 1)
+                f.write(_LENGTH.pack(len(frame)))
+                f.write(frame)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, final)
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+        for name in self._files("snapshot-") + self._files("journal-"):
+            if _seq_of(name) < seq and not name.endswith(".tmp"):
+                os.remove(self._path(name))
+
+    # Startup.
+
+    def restore(self, store):
+        """Rebuild ``store`` from the newest snapshot and the journal after it."""
+        # Hundreds of thousands of new long-lived objects would otherwise
+        # set off one full collection after another.
+        gc.disable()
+        try:
+            self._restore(store)
+        finally:
+            gc.enable()
+
+    def _restore(self, store):
+        started = time.monotonic()
+        snapshots = [name for name in self._files("snapshot-") if name.endswith(".bin")]
+        base_seq = 0
+        restored = 0
+        if snapshots:
+            base_seq = _seq_of(snapshots[-1])
+            with open(self._path(snapshots[-1]), "rb") as f:
+                data = f.read()
+            for chunk in _frames(data):
+                for record in _frames(zlib.decompress(chunk)):
+                    store.put(SessionState.from_record(record, 0))
+                    restored += 1
+
+        replayed = 0
+        for name in self._files("journal-"):
+            if _seq_of(name) < base_seq:
+                continue
+            with open(self._path(name), "rb") as f:
+                for line in f:
+                    try:
+                        delta = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-write.
+                        log.warning("skipping unreadable journal record", segment=name)
+                        continue
+                    self._replay(store, delta)
+                    replayed += 1
+
+        store.enforce_limits()
+        log.info("sessions restored", sessions=len(store), from_snapshot=restored, deltas=replayed,
+                 seconds=round(time.monotonic() - started, 3))
+
+    @staticmethod
+    def _replay(store, delta):
+        session_id = delta[0]
+        if delta[1] is None:
+            store.discard(session_id)
+            return
+        session = store.get(session_id)
+        if session is None:
+            session = SessionState(session_id)
+        session.apply_delta(delta)
+        session.mark_stored()
+        store.put(session)
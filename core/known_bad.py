@@ -0,0 +1,350 @@
+"""Bloom filter of indicators already confirmed as fraudulent.
+
+A message carrying a known-bad UPI ID, phone number, bank account or link
+is a scam whatever the model would say. begin_turn checks the turn's
+extracted indicators against this filter before detect_scam_intent. A hit
+activates the agent on that turn and skips model inference.
+
+Indicators are normalized as in core.intel_index, so "+91 98765 43210"
+and "9876543210" are the same entry. A false positive activates the agent
+on a message that only shares a hash with a known-bad indicator. Its
+probability is KNOWN_BAD_FP_RATE as long as the filter holds at most the
+capacity it was sized for.
+
+The filter lives in KNOWN_BAD_PATH: a short header followed by the bit
+array. A background thread loads it and reloads it when the file changes,
+checking every KNOWN_BAD_CHECK_INTERVAL seconds, so lookups on the event
+loop never touch the disk. It can also be extended at runtime through
+POST /indicators/known-bad. Such an addition is merged into the file under
+a lock, so concurrent workers do not lose each other's entries, but the
+other workers only see it at their next reload.
+
+    python -m core.known_bad build LIST [--out FILE] [--fp-rate 0.001] [--capacity N]
+    python -m core.known_bad check [--path FILE] TYPE VALUE
+
+LIST has one ``TYPE VALUE`` pair per line. TYPE is upiIds, phoneNumbers,
+bankAccounts or phishingLinks.
+"""
+import argparse
+import fcntl
+import hashlib
+import math
+import os
+import struct
+import tempfile
+import threading
+
+from core import metrics
+from core.intel_index import NORMALIZERS, normalize
+from core.log import get_logger
+
+
+# Runtime additions rewrite the file, and the deployed bundle is read-only,
+# so as with the callback outbox the default lives in the temp directory.
+KNOWN_BAD_PATH = os.getenv("KNOWN_BAD_PATH", os.path.join(tempfile.gettempdir(), "honeypot", "known_bad.bloom"))
+KNOWN_BAD_FP_RATE = float(os.getenv("KNOWN_BAD_FP_RATE", "0.001"))
+# Size of a filter created at runtime, when there is no file yet.
+KNOWN_BAD_CAPACITY = int(os.getenv("KNOWN_BAD_CAPACITY", "1000000"))
+KNOWN_BAD_CHECK_INTERVAL = float(os.getenv("KNOWN_BAD_CHECK_INTERVAL", "10"))
+
+MAGIC = b"NYBLOOM1"
+# magic, bits, hashes, entries added, capacity, target false-positive rate
+_HEADER = struct.Struct("<8sQIQQd")
+_MASK64 = (1 << 64) - 1
+
+log = get_logger("known_bad")
+
+KNOWN_BAD_HITS = metrics.counter(
+    "honeypot_known_bad_hits_total", "Turns marked as scams by a known-bad indicator, skipping the model"
+)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, sized for ``capacity`` at ``fp_rate``.
+
+    Positions come from one 128-bit BLAKE2b digest split into two 64-bit
+    halves (Kirsch-Mitzenmacher double hashing), so every lookup costs a
+    single hash.
+    """
+
+    def __init__(self, capacity, fp_rate=KNOWN_BAD_FP_RATE, num_bits=None, num_hashes=None, bits=None, count=0):
+        if not 0 < fp_rate < 1:
+            raise ValueError("fp_rate must be between 0 and 1")
+        self.capacity = max(int(capacity), 1)
+        self.fp_rate = fp_rate
+        self.num_bits = num_bits or max(8, math.ceil(-self.capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.num_hashes = num_hashes or max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return len(self.bits)
+
+    def _hashes(self, key):
+        digest = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest(), "little")
+        return digest & _MASK64, (digest >> 64) | 1
+
+    def add(self, key):
+        h1, h2 = self._hashes(key)
+        bits, m = self.bits, self.num_bits
+        for i in range(self.num_hashes):
+            position = (h1 + i * h2) % m
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        h1, h2 = self._hashes(key)
+        bits, m = self.bits, self.num_bits
+        # Most keys are absent and fail on the first or second probe.
+        for i in range(self.num_hashes):
+            position = (h1 + i * h2) % m
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def to_bytes(self):
+        header = _HEADER.pack(MAGIC, self.num_bits, self.num_hashes, self.count, self.capacity, self.fp_rate)
+        return header + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, num_bits, num_hashes, count, capacity, fp_rate = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("not a known-bad Bloom filter file")
+        bits = bytearray(data[_HEADER.size:])
+        if len(bits) != (num_bits + 7) // 8:
+            raise ValueError("truncated Bloom filter file")
+        return cls(capacity, fp_rate, num_bits=num_bits, num_hashes=num_hashes, bits=bits, count=count)
+
+    def save(self, path):
+        """Write atomically, so a reloading process never sees half a file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def indicator_key(kind, value):
+    """Filter key for an indicator, or None when it does not normalize."""
+    normalized = normalize(kind, value)
+    return None if normalized is None else f"{kind}:{normalized}"
+
+
+class KnownBadIndicators:
+    """The known-bad filter for this process, kept in step with its file.
+
+    File I/O stays off the event loop: a refresher thread loads and reloads
+    the file, and add() runs in the executor. Both swap in a complete
+    filter, so match() never waits on a lock or the disk. Until the first
+    load finishes it matches nothing.
+    """
+
+    def __init__(self, path=KNOWN_BAD_PATH, capacity=KNOWN_BAD_CAPACITY, fp_rate=KNOWN_BAD_FP_RATE,
+                 check_interval=KNOWN_BAD_CHECK_INTERVAL):
+        self.path = path
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.check_interval = check_interval
+        self.bloom = None
+        self._stamp = None
+        # Serializes loads and adds; match() never takes it.
+        self._io_lock = threading.Lock()
+        self._refresher = None
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        if self._refresher is not None:
+            return
+        with self._start_lock:
+            if self._refresher is not None:
+                return
+            self._stopping.clear()
+            self._refresher = threading.Thread(target=self._run, name="known-bad-refresh", daemon=True)
+            self._refresher.start()
+
+    def stop(self, timeout=5.0):
+        with self._start_lock:
+            refresher, self._refresher = self._refresher, None
+        if refresher is not None:
+            self._stopping.set()
+            refresher.join(timeout)
+
+    def _run(self):
+        while True:
+            self.refresh()
+            if self._stopping.wait(self.check_interval):
+                return
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except (OSError, TypeError):
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def refresh(self):
+        """Load the file if it changed since the last load or save."""
+        with self._io_lock:
+            stamp = self._file_stamp()
+            if stamp is None or stamp == self._stamp:
+                return
+            self._stamp = stamp
+            try:
+                bloom = BloomFilter.load(self.path)
+            except (OSError, ValueError, struct.error):
+                log.exception("could not load known-bad filter, keeping the previous one", path=self.path)
+                return
+            self.bloom = bloom
+        log.info("known-bad filter loaded", path=self.path, entries=len(bloom),
+                 capacity=bloom.capacity, bytes=bloom.nbytes)
+
+    def match(self, indicators):
+        """First ``(kind, item)`` in a scan's indicators that is known bad, else None."""
+        if self._refresher is None:
+            self.start()
+        bloom = self.bloom
+        if bloom is None or not bloom.count:
+            return None
+        for kind in NORMALIZERS:
+            for item in indicators.get(kind, ()):
+                key = indicator_key(kind, item)
+                if key is not None and key in bloom:
+                    return kind, item
+        return None
+
+    def _merged_with_file(self):
+        """A new filter holding ``self.bloom`` and the file's current bits; the caller holds the file lock."""
+        current = self.bloom
+        try:
+            on_disk = BloomFilter.load(self.path)
+        except FileNotFoundError:
+            on_disk = None
+        except (OSError, ValueError, struct.error):
+            log.exception("could not read known-bad filter before adding, overwriting it", path=self.path)
+            on_disk = None
+        if on_disk is None:
+            if current is None:
+                return None
+            return BloomFilter(current.capacity, current.fp_rate, num_bits=current.num_bits,
+                               num_hashes=current.num_hashes, bits=bytearray(current.bits), count=current.count)
+        if current is None or (on_disk.num_bits, on_disk.num_hashes) != (current.num_bits, current.num_hashes):
+            # Rebuilt with another size since we loaded it: the file wins.
+            return on_disk
+        merged = int.from_bytes(current.bits, "little") | int.from_bytes(on_disk.bits, "little")
+        on_disk.bits = bytearray(merged.to_bytes(len(on_disk.bits), "little"))
+        on_disk.count = max(current.count, on_disk.count)
+        return on_disk
+
+    def add(self, pairs):
+        """Add ``(kind, value)`` pairs, save the file, and return how many were usable.
+
+        Does blocking file I/O; call it through run_cpu. Other processes
+        sharing the file pick the additions up at their next reload, within
+        KNOWN_BAD_CHECK_INTERVAL seconds.
+        """
+        keys = [key for key in (indicator_key(kind, value) for kind, value in pairs) if key is not None]
+        with self._io_lock:
+            if not self.path:
+                self.bloom = self._with_keys(self.bloom, keys)
+                return len(keys)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Serializes read-merge-write across workers; the data file itself
+            # is replaced atomically, so readers never need the lock.
+            with open(self.path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    bloom = self._with_keys(self._merged_with_file(), keys)
+                    bloom.save(self.path)
+                    self._stamp = self._file_stamp()
+                    self.bloom = bloom
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return len(keys)
+
+    def _with_keys(self, bloom, keys):
+        if bloom is None:
+            bloom = BloomFilter(self.capacity, self.fp_rate)
+        for key in keys:
+            bloom.add(key)
+        if len(bloom) > bloom.capacity:
+            log.warning("known-bad filter is over capacity, false positives will rise; rebuild it larger",
+                        entries=len(bloom), capacity=bloom.capacity)
+        return bloom
+
+
+_known_bad = None
+_known_bad_lock = threading.Lock()
+
+
+def get_known_bad():
+    """Create the filter on first use; its file is read by the refresher thread."""
+    global _known_bad
+    if _known_bad is None:
+        with _known_bad_lock:
+            if _known_bad is None:
+                _known_bad = KnownBadIndicators()
+    return _known_bad
+
+
+metrics.collect(
+    "honeypot_known_bad_entries", "Indicators in the known-bad Bloom filter",
+    lambda: None if _known_bad is None or _known_bad.bloom is None else {(): len(_known_bad.bloom)},
+    kind="gauge"
+)
+
+
+def read_pairs(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                kind, value = line.split(None, 1)
+                yield kind, value.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the known-bad indicator filter")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_cmd = sub.add_parser("build")
+    build_cmd.add_argument("list", help="file of 'TYPE VALUE' lines")
+    build_cmd.add_argument("--out", default=KNOWN_BAD_PATH)
+    build_cmd.add_argument("--fp-rate", type=float, default=KNOWN_BAD_FP_RATE)
+    build_cmd.add_argument("--capacity", type=int, help="entries to size for (default: the list's length plus 25%%)")
+
+    check_cmd = sub.add_parser("check")
+    check_cmd.add_argument("--path", default=KNOWN_BAD_PATH)
+    check_cmd.add_argument("type", choices=list(NORMALIZERS))
+    check_cmd.add_argument("value")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        keys = [key for key in (indicator_key(kind, value) for kind, value in read_pairs(args.list))
+                if key is not None]
+        bloom = BloomFilter(args.capacity or len(keys) * 5 // 4 or 1, args.fp_rate)
+        for key in keys:
+            bloom.add(key)
+        bloom.save(args.out)
+        print(f"{len(keys)} indicators, {bloom.num_bits} bits ({bloom.nbytes / 1e6:.1f} MB), "
+              f"{bloom.num_hashes} hashes, written to {args.out}")
+        return
+
+    bloom = BloomFilter.load(args.path)
+    key = indicator_key(args.type, args.value)
+    print("probably known bad" if key is not None and key in bloom else "not known bad")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,46 @@
+import asyncio
 import os
 import random
-from typing import List, Dict
-from google import genai
-from google.genai import types
+import threading
+import time
+from collections import deque
+from typing import List, Dict, Optional
+
+from core import metrics
+from core.llm_guard import LLMGuard
+from core.log import get_logger
+from core.metrics import STAGE_SECONDS
+from core.sessions import HISTORY_WINDOW
 
-client = genai.Client(api_key=os.getenv("LLM_API_KEY"))
 MODEL_ID = "gemini-1.5-flash"
 
+log = get_logger("llm_agent")
+
+_client = None
+_client_lock = threading.Lock()
+
+# Bounds every Gemini call: deadline, in-flight cap, circuit breaker and
+# optional hedging. See core/llm_guard.py.
+llm_guard = LLMGuard()
+LLM_STATS = {"fallbacks": 0}
+
+
+def get_client():
+    """Build the genai client on first use; importing google.genai is slow."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google import genai
+                _client = genai.Client(api_key=os.getenv("LLM_API_KEY"))
+    return _client
+
+
+def set_client(client):
+    """Swap in another client, e.g. core.stubs.StubGenaiClient for offline runs."""
+    global _client
+    _client = client
+
 SYSTEM_RULES = """
 You are Rajesh Kumar, a 54-year-old bank customer from Delhi. You are confused, scared, and don't really understand tech.
 You're getting messages from someone claiming to be from the bank about account issues.
@@ -199,30 +233,9 @@ def generate_dynamic_fallback(goal: str, previous_messages: List[str]) -> str:
     # If all options repeat, still return random one
     return random.choice(options)
 
-def llm_generate(goal: str, conversation_history: List[Dict[str, str]]) -> str:
-    """Generate human-like responses using LLM with strong anti-repetition"""
-    
-    # Use more context for better continuity
-    recent_history = conversation_history[-10:] if len(conversation_history) > 10 else conversation_history
-    
-    # Format conversation history more naturally
-    history_text = "\n".join([
-        f"{'Rajesh' if msg['role'] == 'user' else 'Bank Rep'}: {msg['content']}"
-        for msg in recent_history
-    ])
-    
-    # Extract phrases you've already used to avoid repetition
-    your_previous_messages = [msg['content'] for msg in recent_history if msg['role'] == 'user']
-    
-    user_message = f"""CONVERSATION SO FAR:
-{history_text}
-
-YOUR SITUATION: {GOAL_PROMPTS.get(goal, goal)}
-
-WHAT YOU'VE ALREADY SAID:
-{your_previous_messages[-3:] if your_previous_messages else 'Nothing yet'}
-
-CRITICAL INSTRUCTIONS:
+# Static part of every turn's instructions. When the persona prefix is
+# served from the upstream context cache this moves into the cache too.
+STATIC_INSTRUCTIONS = """CRITICAL INSTRUCTIONS:
 1. Write as Rajesh would naturally text on his phone
 2. DO NOT copy any phrase from your previous messages
 3. Vary your vocabulary - if you said "link not opening", now say "site won't load" or "getting error page"
@@ -230,34 +243,353 @@ CRITICAL INSTRUCTIONS:
 5. Match your emotional state to the situation (confused/frustrated/eager to help)
 6. Sound like a real person texting, not a script
 
-                Your confusion and fear is growing. Keep saying: "i'm scared", "this seems strange", "why all this?"
+                Your confusion and fear is growing. Keep saying: "i'm scared", "this seems strange", "why all this?\""""
+
+PERSONA_PREFIX = (
+    SYSTEM_RULES
+    + "\nSITUATIONS (referred to by name in each message):\n\n"
+    + "\n\n".join(f"[{goal}]\n{prompt}" for goal, prompt in GOAL_PROMPTS.items())
+    + "\n\n" + STATIC_INSTRUCTIONS
+)
+
+# Prompt size per turn stays flat: this many recent messages verbatim, and
+# older ones folded into a bounded summary of short fragments.
+PROMPT_RECENT_MESSAGES = int(os.getenv("PROMPT_RECENT_MESSAGES", "6"))
+PROMPT_SUMMARY_FRAGMENTS = int(os.getenv("PROMPT_SUMMARY_FRAGMENTS", "4"))
+SUMMARY_FRAGMENT_WORDS = 8
+
+LLM_CONTEXT_CACHE = os.getenv("LLM_CONTEXT_CACHE") == "1"
+LLM_CONTEXT_CACHE_TTL = int(os.getenv("LLM_CONTEXT_CACHE_TTL", "3600"))
+
+
+def _render(msg: Dict[str, str]) -> str:
+    return f"{'Rajesh' if msg['role'] == 'user' else 'Bank Rep'}: {msg['content']}"
+
+
+def _compact(line: str) -> str:
+    words = line.split()
+    if len(words) <= SUMMARY_FRAGMENT_WORDS:
+        return line
+    return " ".join(words[:SUMMARY_FRAGMENT_WORDS]) + " ..."
+
+
+class PromptState:
+    """Per-session prompt pieces, updated with only the turns added since last time."""
+
+    __slots__ = ("recent", "summary", "said", "ingested")
+
+    def __init__(self):
+        self.recent = deque()
+        self.summary = deque(maxlen=PROMPT_SUMMARY_FRAGMENTS)
+        self.said = deque(maxlen=3)
+        self.ingested = 0
+
+    def extend(self, messages):
+        for msg in messages:
+            self.recent.append(_render(msg))
+            if msg["role"] == "user":
+                self.said.append(msg["content"])
+            if len(self.recent) > PROMPT_RECENT_MESSAGES:
+                self.summary.append(_compact(self.recent.popleft()))
+            self.ingested += 1
+
+    def sync(self, history):
+        """Catch up with a session's MessageHistory."""
+        new = history.total - self.ingested
+        if new > 0:
+            self.extend(history.recent(new))
+            self.ingested = history.total
+
+
+def prompt_state_for(session) -> PromptState:
+    if session.prompt_state is None:
+        session.prompt_state = PromptState()
+    session.prompt_state.sync(session.messages)
+    return session.prompt_state
+
+
+def build_user_message(goal: str, state: PromptState, cached_prefix: bool) -> str:
+    parts = []
+    if state.summary:
+        parts.append("EARLIER IN THE CONVERSATION (shortened):\n" + "\n".join(state.summary) + "\n")
+    parts.append("CONVERSATION SO FAR:\n" + "\n".join(state.recent) + "\n")
+    if cached_prefix and goal in GOAL_PROMPTS:
+        parts.append(f"YOUR SITUATION: [{goal}]\n")
+    else:
+        parts.append(f"YOUR SITUATION: {GOAL_PROMPTS.get(goal, goal)}\n")
+    parts.append(f"WHAT YOU'VE ALREADY SAID:\n{list(state.said) if state.said else 'Nothing yet'}\n")
+    if not cached_prefix:
+        parts.append(STATIC_INSTRUCTIONS + "\n")
+    parts.append("Write Rajesh's next message now (short, confused, scared, human-like):")
+    return "\n".join(parts)
+
+
+class PersonaCache:
+    """Upstream context cache holding PERSONA_PREFIX, created on first use.
+
+    Off unless LLM_CONTEXT_CACHE=1. If the API refuses (for example when the
+    prefix is below the model's minimum cacheable size) it stays off and
+    prompts carry the persona inline as before.
+    """
+
+    def __init__(self, enabled=LLM_CONTEXT_CACHE, ttl=LLM_CONTEXT_CACHE_TTL):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.name = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> Optional[str]:
+        if not self.enabled:
+            return None
+        if self.name and time.time() < self._expires_at - 60:
+            return self.name
+        async with self._lock:
+            if self.name and time.time() < self._expires_at - 60:
+                return self.name
+            try:
+                from google.genai import types
+                cache = await get_client().aio.caches.create(
+                    model=MODEL_ID,
+                    config=types.CreateCachedContentConfig(
+                        system_instruction=PERSONA_PREFIX,
+                        ttl=f"{self.ttl}s",
+                        display_name="honeypot-persona"
+                    )
+                )
+                self.name = cache.name
+                self._expires_at = time.time() + self.ttl
+            except Exception as e:
+                log.warning("LLM context cache unavailable, sending persona inline", error=str(e))
+                self.enabled = False
+                self.name = None
+        return self.name
+
+
+persona_cache = PersonaCache()
+
 
-Write Rajesh's next message now (short, confused, scared, human-like):"""
+STOP_SEQUENCES = ['\n\n', 'Bank Rep:', 'Rajesh:', 'Scammer:']
+SPEAKER_LABELS = ('Rajesh:', 'User:')
+REPLY_MIN_WORDS = 3
+REPLY_MAX_WORDS = 50
+
+
+def _prompt_state(conversation_history, session) -> PromptState:
+    if session is not None:
+        return prompt_state_for(session)
+    state = PromptState()
+    state.extend(conversation_history[-HISTORY_WINDOW:])
+    return state
+
+
+async def _build_request(goal: str, state: PromptState):
+    from google.genai import types
+    cache_name = await persona_cache.get()
+    user_message = build_user_message(goal, state, cached_prefix=cache_name is not None)
+    persona = {"cached_content": cache_name} if cache_name else {"system_instruction": SYSTEM_RULES}
+    config = types.GenerateContentConfig(
+        **persona,
+        temperature=1.2,
+        top_p=0.97,
+        top_k=50,
+        max_output_tokens=150,
+        stop_sequences=STOP_SEQUENCES
+    )
+    return user_message, config
+
+
+async def llm_generate(goal: str, conversation_history: List[Dict[str, str]], fallback: bool = True,
+                       session=None) -> Optional[str]:
+    """Generate human-like responses using LLM with strong anti-repetition
+
+    With ``session`` the prompt is built from the session's incremental
+    PromptState; otherwise from ``conversation_history``. With
+    ``fallback=False`` a failed or unusable generation returns None instead
+    of a canned reply.
+    """
+    state = _prompt_state(conversation_history, session)
+    
+    # Extract phrases you've already used to avoid repetition
+    your_previous_messages = list(state.said)
 
     try:
-        response = client.models.generate_content(
-            model=MODEL_ID,
-            contents=user_message,
-            config=types.GenerateContentConfig(
-                system_instruction=SYSTEM_RULES,
-                temperature=1.2,
-                top_p=0.97,
-                top_k=50,
-                max_output_tokens=150,
-                stop_sequences=['\n\n', 'Bank Rep:', 'Rajesh:', 'Scammer:']
+        user_message, config = await _build_request(goal, state)
+        with STAGE_SECONDS.time(stage="llm"):
+            response = await llm_guard.run(
+                lambda: get_client().aio.models.generate_content(
+                    model=MODEL_ID,
+                    contents=user_message,
+                    config=config
+                )
             )
-        )
 
         text = response.text.strip() if response.text else ""
         
-        text = text.replace('Rajesh:', '').replace('User:', '').strip()
+        for label in SPEAKER_LABELS:
+            text = text.replace(label, '')
+        text = text.strip()
         
-        if not text or len(text.split()) > 50 or len(text.split()) < 3:
-            return generate_dynamic_fallback(goal, your_previous_messages)
+        if not text or len(text.split()) > REPLY_MAX_WORDS or len(text.split()) < REPLY_MIN_WORDS:
+            return _fallback(goal, your_previous_messages, fallback)
 
         return text
 
     except Exception as e:
-        print(f"LLM Error: {e}")
-        return generate_dynamic_fallback(goal, your_previous_messages)
+        log.warning("LLM call failed, using fallback", goal=goal, error=f"{type(e).__name__}: {e}")
+        return _fallback(goal, your_previous_messages, fallback)
+
+
+class StreamCleaner:
+    """Incremental version of llm_generate's post-processing.
+
+    ``feed`` takes raw chunks and returns the whole words that are safe to
+    send on. Speaker labels are dropped, output ends at the first stop sequence, and
+    a tail as long as the longest marker is held back in case a marker is
+    split across chunks. Nothing is released until the reply has
+    REPLY_MIN_WORDS words, so a too-short generation can still be replaced
+    by a fallback. Replies are cut at REPLY_MAX_WORDS words, because text
+    that has already been sent cannot be taken back.
+    """
+
+    HOLD = max(len(marker) for marker in STOP_SEQUENCES + list(SPEAKER_LABELS)) - 1
+
+    def __init__(self):
+        self.pending = ""
+        self.emitted = ""
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        if self.done:
+            return ""
+        self.pending += chunk
+        for label in SPEAKER_LABELS:
+            self.pending = self.pending.replace(label, '')
+        cut = min((i for i in (self.pending.find(s) for s in STOP_SEQUENCES) if i >= 0), default=-1)
+        if cut >= 0:
+            self.pending = self.pending[:cut]
+            self.done = True
+            return ""
+        # Release whole words only, keeping the last HOLD characters back.
+        split = max(self.pending.rfind(" ", 0, len(self.pending) - self.HOLD),
+                    self.pending.rfind("\n", 0, len(self.pending) - self.HOLD)) + 1
+        if split <= 0:
+            return ""
+        ready, self.pending = self.pending[:split], self.pending[split:]
+        return self._release(ready)
+
+    def finish(self) -> str:
+        """Flush whatever is held back; call once the upstream stream ends."""
+        self.done = False
+        text = self._release(self.pending)
+        self.pending = ""
+        self.done = True
+        return text
+
+    def _release(self, ready: str) -> str:
+        if not self.emitted:
+            ready = ready.lstrip()
+        candidate = self.emitted + ready
+        words = candidate.split()
+        if len(words) > REPLY_MAX_WORDS:
+            ready = _first_words(ready, REPLY_MAX_WORDS - len(self.emitted.split()))
+            self.done = True
+        elif len(words) < REPLY_MIN_WORDS and not self.done:
+            # Hold everything back until the reply is known to be long enough.
+            self.pending = ready + self.pending
+            return ""
+        self.emitted += ready
+        return ready
+
+    @property
+    def usable(self) -> bool:
+        return len(self.emitted.split()) >= REPLY_MIN_WORDS
+
+
+def _first_words(text: str, count: int) -> str:
+    seen = 0
+    for i, ch in enumerate(text):
+        if not ch.isspace() and (i == 0 or text[i - 1].isspace()):
+            seen += 1
+            if seen > count:
+                return text[:i].rstrip()
+    return text
+
+
+async def llm_stream(goal: str, conversation_history: List[Dict[str, str]], session=None):
+    """Streaming counterpart of llm_generate, yielding cleaned text pieces.
+
+    Opening the stream and receiving the first chunk goes through llm_guard,
+    so the deadline bounds time-to-first-token; the remaining chunks must
+    arrive within another LLM_TIMEOUT_SECONDS. If the stream fails before
+    any text was released the canned fallback is yielded instead; after
+    that the reply simply ends where the stream broke off.
+    """
+    state = _prompt_state(conversation_history, session)
+    your_previous_messages = list(state.said)
+    cleaner = StreamCleaner()
+
+    async def open_stream():
+        stream = await get_client().aio.models.generate_content_stream(
+            model=MODEL_ID,
+            contents=user_message,
+            config=config
+        )
+        chunks = stream.__aiter__()
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = None
+        return first, chunks
+
+    try:
+        user_message, config = await _build_request(goal, state)
+        with STAGE_SECONDS.time(stage="llm_first_chunk"):
+            first, chunks = await llm_guard.run(open_stream)
+        deadline = time.monotonic() + llm_guard.timeout
+        chunk = first
+        while chunk is not None and not cleaner.done:
+            piece = cleaner.feed(chunk.text or "")
+            if piece:
+                yield piece
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - time.monotonic(), 0))
+            except StopAsyncIteration:
+                chunk = None
+        piece = cleaner.finish()
+        if piece:
+            yield piece
+    except Exception as e:
+        log.warning("LLM stream failed", goal=goal, error=f"{type(e).__name__}: {e}")
+
+    if not cleaner.usable:
+        yield _fallback(goal, your_previous_messages, True)
+
+
+def _fallback(goal: str, previous_messages: List[str], enabled: bool) -> Optional[str]:
+    if not enabled:
+        return None
+    LLM_STATS["fallbacks"] += 1
+    return generate_dynamic_fallback(goal, previous_messages)
+
+
+def llm_stats() -> dict:
+    return dict(llm_guard.snapshot(), **LLM_STATS)
+
+
+BREAKER_STATES = ("closed", "half_open", "open")
 
+metrics.collect(
+    "honeypot_llm_events_total", "LLM calls by outcome, plus hedges and canned fallbacks",
+    lambda: {event: count for event, count in llm_stats().items() if event not in ("in_flight", "breaker_state")},
+    labelnames=("event",)
+)
+metrics.collect(
+    "honeypot_llm_in_flight", "LLM requests currently waiting on the upstream",
+    lambda: {(): llm_guard.in_flight}, kind="gauge"
+)
+metrics.collect(
+    "honeypot_llm_breaker_state", "1 for the circuit breaker's current state, 0 for the others",
+    lambda: {state: int(llm_guard.breaker.state == state) for state in BREAKER_STATES},
+    kind="gauge", labelnames=("state",)
+)
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "8"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Fire a second request once the first is slower than this percentile of
+# recent calls; 0 disables hedging.
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+LLM_HEDGE_MIN_SAMPLES = 20
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling the LLM while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Open after ``failures`` consecutive errors, probe again after ``cooldown``."""
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open" and not self._probing:
+            # Let exactly one request through to test the upstream.
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self._consecutive = 0
+        self._probing = False
+
+    def release_probe(self):
+        """Free the half-open probe slot without judging the upstream.
+
+        For a call that ended without an answer either way, e.g. one
+        cancelled because the client went away.
+        """
+        self._probing = False
+
+    def record_failure(self):
+        self._consecutive += 1
+        if self.state == "half_open" or self._consecutive >= self.failures:
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class LatencyTracker:
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+
+    def percentile(self, p):
+        if len(self._samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class LLMGuard:
+    """Deadline, concurrency cap, circuit breaker and hedging for LLM calls.
+
+    ``run`` takes a zero-argument coroutine factory so a hedged attempt can
+    issue the same request again. Every outcome is counted in ``stats``.
+    """
+
+    def __init__(self, timeout=LLM_TIMEOUT_SECONDS, max_concurrency=LLM_MAX_CONCURRENCY,
+                 hedge_percentile=LLM_HEDGE_PERCENTILE):
+        self.timeout = timeout
+        self.hedge_percentile = hedge_percentile
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.stats = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "short_circuited": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+        }
+
+    async def run(self, make_call):
+        if not self.breaker.allow():
+            self.stats["short_circuited"] += 1
+            raise UpstreamUnavailable("LLM circuit breaker is open")
+
+        self.stats["calls"] += 1
+        try:
+            result = await asyncio.wait_for(self._hedged(make_call), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            self.stats["failures"] += 1
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled (CancelledError is not an Exception). Nothing was
+            # learned about the upstream, but a half-open probe must not
+            # hold its slot forever or every later call short-circuits.
+            self.breaker.release_probe()
+            raise
+        self.stats["successes"] += 1
+        self.breaker.record_success()
+        return result
+
+    async def _attempt(self, make_call):
+        async with self._semaphore:
+            self.in_flight += 1
+            start = time.monotonic()
+            try:
+                result = await make_call()
+            finally:
+                self.in_flight -= 1
+            self.latency.record(time.monotonic() - start)
+            return result
+
+    async def _hedged(self, make_call):
+        delay = self.latency.percentile(self.hedge_percentile) if self.hedge_percentile > 0 else None
+        first = asyncio.ensure_future(self._attempt(make_call))
+        if delay is None:
+            return await first
+
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and not self._semaphore.locked():
+                self.stats["hedges"] += 1
+                tasks.add(asyncio.ensure_future(self._attempt(make_call)))
+
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if not first.done():
+                first.cancel()
+
+    def snapshot(self):
+        return dict(self.stats, in_flight=self.in_flight, breaker_state=self.breaker.state)
@@ -0,0 +1,145 @@
+"""Queue-backed JSON logging that keeps log I/O off the request path.
+
+``get_logger(name)`` returns a logger whose records go onto a bounded
+in-memory queue. One background thread formats them as JSON lines and
+writes them to stderr. Calls on a request path only do the following:
+- check the level
+- for DEBUG, roll the sampling dice
+- build the message from its %-style args
+- put the record on the queue without waiting
+
+When the queue is full the record is dropped and counted in
+``honeypot_log_dropped_total``.
+
+Structured fields go in keyword arguments::
+
+    log.info("scam intent detected", session_id=session_id)
+    log.debug("scan result %s", indicators, session_id=session_id)
+
+Settings:
+- LOG_LEVEL: default INFO.
+- LOG_DEBUG_SAMPLE: the fraction of DEBUG lines kept, default 0.01.
+- LOG_QUEUE_SIZE: the queue bound.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from core import metrics
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_DEBUG_SAMPLE = float(os.getenv("LOG_DEBUG_SAMPLE", "0.01"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+LOGS_DROPPED = metrics.counter("honeypot_log_dropped_total", "Log records dropped because the queue was full")
+
+# Attributes every LogRecord has; anything else on a record is a field.
+_RESERVED = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DebugSampler(logging.Filter):
+    """Keep only ``rate`` of DEBUG records; other levels always pass."""
+
+    def __init__(self, rate=LOG_DEBUG_SAMPLE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOGS_DROPPED.inc()
+
+    def prepare(self, record):
+        # Merge args into the message now, while they still hold the values
+        # from the time of the call; JSON encoding happens on the listener.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """Logger taking structured fields as keyword arguments."""
+
+    def __init__(self, logger):
+        super().__init__(logger, {})
+
+    def log(self, level, msg, *args, exc_info=None, stack_info=False, **fields):
+        if self.logger.isEnabledFor(level):
+            self.logger._log(level, msg, args, exc_info=exc_info, extra=fields or None,
+                             stack_info=stack_info, stacklevel=2)
+
+    def debug(self, msg, *args, **fields):
+        self.log(logging.DEBUG, msg, *args, **fields)
+
+    def info(self, msg, *args, **fields):
+        self.log(logging.INFO, msg, *args, **fields)
+
+    def warning(self, msg, *args, **fields):
+        self.log(logging.WARNING, msg, *args, **fields)
+
+    def error(self, msg, *args, **fields):
+        self.log(logging.ERROR, msg, *args, **fields)
+
+    def exception(self, msg, *args, **fields):
+        self.log(logging.ERROR, msg, *args, exc_info=True, **fields)
+
+
+_listener = None
+_setup_lock = threading.Lock()
+ROOT_LOGGER = "honeypot"
+
+
+def _setup():
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JsonFormatter())
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        handler = NonBlockingQueueHandler(log_queue)
+        handler.addFilter(DebugSampler())
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(handler)
+        root.propagate = False
+
+
+def get_logger(name):
+    """Logger for a module, e.g. ``get_logger("flow")`` -> ``honeypot.flow``."""
+    _setup()
+    return StructuredLogger(logging.getLogger(f"{ROOT_LOGGER}.{name}"))
@@ -0,0 +1,113 @@
+import asyncio
+import os
+from collections import deque
+
+from core import metrics
+from core.llm_agent import GOAL_PROMPTS, llm_generate
+
+
+REPLY_POOL_SIZE = int(os.getenv("REPLY_POOL_SIZE", "4"))
+# Turns up to this count are answered from the pool when it has a reply.
+REPLY_POOL_MAX_TURNS = int(os.getenv("REPLY_POOL_MAX_TURNS", "2"))
+REPLY_POOL_CONCURRENCY = int(os.getenv("REPLY_POOL_CONCURRENCY", "2"))
+
+# A typical opener, so pooled replies read like an answer to a first
+# contact rather than to nothing.
+GENERIC_HISTORY = [
+    {"role": "assistant", "content": "Dear customer, this is from your bank. Your account will be blocked today due to pending KYC. Please verify immediately."},
+]
+
+
+class ReplyPool:
+    """Bounded per-goal pools of pre-generated persona replies.
+
+    A background task keeps every goal in ``GOAL_PROMPTS`` topped up to
+    ``size`` replies, generated against ``GENERIC_HISTORY``. Taking a reply
+    wakes the producer so the pool refills while requests keep flowing.
+    """
+
+    def __init__(self, goals, size=REPLY_POOL_SIZE, concurrency=REPLY_POOL_CONCURRENCY):
+        self.size = size
+        self.concurrency = concurrency
+        self.hits = 0
+        self.misses = 0
+        self._pools = {goal: deque(maxlen=size) for goal in goals}
+        self._wakeup = None
+        self._task = None
+
+    def take(self, goal, avoid=()):
+        pool = self._pools.get(goal)
+        while pool:
+            reply = pool.popleft()
+            if reply not in avoid:
+                self.hits += 1
+                self._refill()
+                return reply
+        self.misses += 1
+        self._refill()
+        return None
+
+    def levels(self):
+        return {goal: len(pool) for goal, pool in self._pools.items()}
+
+    def start(self):
+        if self.size <= 0 or self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._produce())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _refill(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _produce(self):
+        while True:
+            self._wakeup.clear()
+            wanted = [goal for goal, pool in self._pools.items() if len(pool) < self.size]
+            if not wanted:
+                await self._wakeup.wait()
+                continue
+
+            batch = wanted[:self.concurrency]
+            replies = await asyncio.gather(
+                *(llm_generate(goal, GENERIC_HISTORY, fallback=False) for goal in batch),
+                return_exceptions=True,
+            )
+            produced = 0
+            for goal, reply in zip(batch, replies):
+                if isinstance(reply, str) and reply not in self._pools[goal]:
+                    self._pools[goal].append(reply)
+                    produced += 1
+            if produced == 0:
+                # Upstream is failing; back off instead of hammering it.
+                await asyncio.sleep(5)
+
+
+reply_pool = ReplyPool(GOAL_PROMPTS)
+
+metrics.collect(
+    "honeypot_reply_pool_total", "Early-turn replies served from the pool, or missed",
+    lambda: {"hit": reply_pool.hits, "miss": reply_pool.misses},
+    labelnames=("result",)
+)
+metrics.collect(
+    "honeypot_reply_pool_ready", "Pre-generated replies waiting, per goal",
+    reply_pool.levels, kind="gauge", labelnames=("goal",)
+)
+
+
+def pooled_reply(goal, session):
+    if session.turns > REPLY_POOL_MAX_TURNS:
+        return None
+    previous = {msg["content"] for msg in session.messages if msg["role"] == "user"}
+    return reply_pool.take(goal, avoid=previous)
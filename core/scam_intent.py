@@ -1,5 +1,89 @@
-import joblib
+import asyncio
+import hashlib
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from core import metrics
+from core.extractor import register_keywords, scan_message
+from core.log import get_logger
+from core.workers import cpu_executor
+
+log = get_logger("scam_intent")
+
+
+SCAM_BATCH_MAX = int(os.getenv("SCAM_BATCH_MAX", "32"))
+SCAM_BATCH_WAIT_MS = float(os.getenv("SCAM_BATCH_WAIT_MS", "5"))
+SCAM_CACHE_SIZE = int(os.getenv("SCAM_CACHE_SIZE", "50000"))
+SCAM_CACHE_TTL = float(os.getenv("SCAM_CACHE_TTL", "3600"))
+MODEL_CHECK_INTERVAL = float(os.getenv("MODEL_CHECK_INTERVAL", "10"))
+USE_TFIDF_MMAP = os.getenv("TFIDF_MMAP", "1") != "0"
+USE_XGB_FAST_PATH = os.getenv("XGB_FAST_PATH", "1") != "0"
+
+FALLBACK_KEYWORDS = [
+    "urgent", "verify", "blocked", "suspended", "click", "otp",
+    "prize", "winner", "lottery", "account", "password", "bank",
+    "transfer", "payment", "kyc", "expire", "limited time"
+]
+register_keywords("scam_fallback", FALLBACK_KEYWORDS)
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_DIGIT_RUN_RE = re.compile(r"\d+")
+
+
+def normalize_text(text: str) -> str:
+    """Fold case, whitespace and digit runs so templated openers share a key."""
+    return _DIGIT_RUN_RE.sub("0", _WHITESPACE_RE.sub(" ", text.lower()).strip())
+
+
+def cache_key(text: str) -> bytes:
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).digest()
+
+
+class ProbabilityCache:
+    """Bounded LRU of scam probabilities with a per-entry TTL."""
+
+    def __init__(self, max_size=SCAM_CACHE_SIZE, ttl=SCAM_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key) -> Optional[float]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value: float):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
 
 
 class ScamIntentDetector:
@@ -8,33 +92,99 @@ class ScamIntentDetector:
         self.vectorizer = None  # TF-IDF Vectorizer
         self.classifier = None  # XGBoost Classifier
         self.models_loaded = False
+        self._booster = None  # Raw booster for the fast path, when usable
 
         self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.models_dir = os.path.join(self.base_dir, "models")
+        self.vectorizer_path = os.path.join(self.models_dir, "tfidf_vectorizer.pkl")
+        self.classifier_path = os.path.join(self.models_dir, "xgb_scam_classifier.pkl")
+        # Optional shared export of the vectorizer, see core/tfidf_mmap.py.
+        self.mmap_path = os.path.join(self.models_dir, "tfidf_vectorizer.mmap")
+
+        self.cache = ProbabilityCache()
+        self._model_stamp = self._read_model_stamp()
+        self._next_model_check = time.monotonic() + MODEL_CHECK_INTERVAL
+        self._reload_lock = threading.Lock()
 
         self._load_models()
     
+    def _read_model_stamp(self):
+        stamp = []
+        for path in (self.vectorizer_path, self.classifier_path, self.mmap_path):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+    
+    def _check_models_changed(self):
+        """Reload models and drop cached scores when files in models/ change."""
+        now = time.monotonic()
+        if now < self._next_model_check:
+            return
+        with self._reload_lock:
+            if now < self._next_model_check:
+                return
+            self._next_model_check = now + MODEL_CHECK_INTERVAL
+            stamp = self._read_model_stamp()
+            if stamp == self._model_stamp:
+                return
+            log.info("model files changed, reloading and clearing cache")
+            self._model_stamp = stamp
+            self._load_models()
+            self.cache.clear()
+    
     def _load_models(self):
-        vectorizer_path = os.path.join(self.models_dir, "tfidf_vectorizer.pkl")
-        classifier_path = os.path.join(self.models_dir, "xgb_scam_classifier.pkl")
+        vectorizer_path = self.vectorizer_path
+        classifier_path = self.classifier_path
         
         if not os.path.exists(vectorizer_path):
-            print(f"Warning: TF-IDF vectorizer not found at {vectorizer_path}")
+            log.warning("TF-IDF vectorizer not found", path=vectorizer_path)
             return
         
         if not os.path.exists(classifier_path):
-            print(f"Warning: XGBoost classifier not found at {classifier_path}")
+            log.warning("XGBoost classifier not found", path=classifier_path)
             return
         
         try:
-            self.vectorizer = joblib.load(vectorizer_path)
+            # Deferred so importing the app does not pay for numpy/sklearn.
+            import joblib
+            self.vectorizer = self._load_vectorizer(joblib)
             self.classifier = joblib.load(classifier_path)
+            self._prepare_fast_path()
             self.models_loaded = True
-            print("TF-IDF + XGBoost scam detection models loaded successfully!")
-        except Exception as e:
-            print(f"Error loading scam detection models: {e}")
+            log.info("TF-IDF + XGBoost scam detection models loaded")
+        except Exception:
+            log.exception("error loading scam detection models")
             self.models_loaded = False
     
+    def _prepare_fast_path(self):
+        """Use the underlying booster directly when it gives predict_proba's answer.
+
+        For one short message the sklearn wrapper spends more time on input
+        validation and DMatrix setup than on the trees. ``inplace_predict``
+        takes the CSR matrix as is.
+        """
+        self._booster = None
+        if not USE_XGB_FAST_PATH or not hasattr(self.classifier, "get_booster"):
+            return
+        if getattr(self.classifier, "objective", None) not in ("binary:logistic", "multi:softprob"):
+            return
+        best_iteration = getattr(self.classifier, "best_iteration", None)
+        self._iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+        self._missing = getattr(self.classifier, "missing", float("nan"))
+        self._booster = self.classifier.get_booster()
+    
+    def _load_vectorizer(self, joblib):
+        if USE_TFIDF_MMAP and os.path.exists(self.mmap_path):
+            if os.path.getmtime(self.mmap_path) >= os.path.getmtime(self.vectorizer_path):
+                from core.tfidf_mmap import MmapTfidfVectorizer
+                log.info("using memory-mapped TF-IDF vocabulary", path=self.mmap_path)
+                return MmapTfidfVectorizer(self.mmap_path)
+            log.warning("tfidf_vectorizer.mmap is older than the pickle, re-run: python -m core.tfidf_mmap export")
+        return joblib.load(self.vectorizer_path)
+    
     def predict(self, text: str, threshold: float = 0.5) -> bool:
         if not self.models_loaded:
             return self._fallback_prediction(text)
@@ -44,44 +194,184 @@ class ScamIntentDetector:
             probability = self.get_probability(text)
             is_scam = probability >= threshold
             
-            print(f"[ScamDetector] Probability: {probability:.2%} | Threshold: {threshold:.0%} | Is Scam: {is_scam}")
+            log.debug("scored message", probability=round(probability, 4), threshold=threshold, is_scam=is_scam)
             
             return is_scam
             
-        except Exception as e:
-            print(f"Error during prediction: {e}")
+        except Exception:
+            log.exception("error during prediction")
             return self._fallback_prediction(text)
     
     def get_probability(self, text: str) -> float:
+        return self.get_probabilities([text])[0]
+    
+    def get_probabilities(self, texts: List[str]) -> List[float]:
+        """Score many texts; cached texts skip the model, the rest go in one batch."""
+        self._check_models_changed()
         if not self.models_loaded:
-            return 0.0
+            return [0.0] * len(texts)
         
-        try:
-            text_vectorized = self.vectorizer.transform([text])
-            
-            if hasattr(self.classifier, 'predict_proba'):
-                proba = self.classifier.predict_proba(text_vectorized)[0]
-                # Assuming index 1 is the "scam" class
-                return float(proba[1]) if len(proba) > 1 else float(proba[0])
+        probabilities = [None] * len(texts)
+        keys = [cache_key(text) for text in texts]
+        missing = []
+        for i, key in enumerate(keys):
+            cached = self.cache.get(key)
+            if cached is None:
+                missing.append(i)
             else:
-                prediction = self.classifier.predict(text_vectorized)[0]
-                return 1.0 if prediction else 0.0
-                
-        except Exception as e:
-            print(f"Error getting probability: {e}")
-            return 0.0
+                probabilities[i] = cached
+        
+        if missing:
+            try:
+                scored = self._score([texts[i] for i in missing])
+            except Exception:
+                log.exception("error getting probability", texts=len(missing))
+                scored = None
+            for n, i in enumerate(missing):
+                if scored is None:
+                    probabilities[i] = 0.0
+                else:
+                    probabilities[i] = scored[n]
+                    self.cache.put(keys[i], scored[n])
+        
+        return probabilities
+    
+    def _score(self, texts: List[str]) -> List[float]:
+        text_vectorized = self.vectorizer.transform(texts)
+        
+        if self._booster is not None:
+            return self._booster_scores(text_vectorized)
+        elif hasattr(self.classifier, 'predict_proba'):
+            proba = self.classifier.predict_proba(text_vectorized)
+            # Assuming index 1 is the "scam" class
+            column = 1 if proba.shape[1] > 1 else 0
+            return [float(p) for p in proba[:, column]]
+        else:
+            predictions = self.classifier.predict(text_vectorized)
+            return [1.0 if p else 0.0 for p in predictions]
+    
+    def _booster_scores(self, text_vectorized) -> List[float]:
+        output = self._booster.inplace_predict(
+            text_vectorized,
+            iteration_range=self._iteration_range,
+            missing=self._missing,
+            validate_features=False,
+        )
+        if output.ndim == 2:
+            output = output[:, 1]
+        return output.tolist()
+    
+    def predict_many(self, texts: List[str], threshold: float = 0.5) -> List[bool]:
+        return [is_scam for _, is_scam in self.classify(texts, threshold)]
+    
+    def classify(self, texts: List[str], threshold: float = 0.5) -> List[Tuple[float, bool]]:
+        """Return ``(probability, is_scam)`` per text, batched like ``get_probabilities``."""
+        if not self.models_loaded:
+            return [(0.0, self._fallback_prediction(text)) for text in texts]
+        
+        probabilities = self.get_probabilities(texts)
+        scams = sum(1 for p in probabilities if p >= threshold)
+        log.debug("scored batch", texts=len(texts), threshold=threshold, scams=scams)
+        return [(p, p >= threshold) for p in probabilities]
     
     def _fallback_prediction(self, text: str) -> bool:
-        SCAM_KEYWORDS = [
-            "urgent", "verify", "blocked", "suspended", "click", "otp",
-            "prize", "winner", "lottery", "account", "password", "bank",
-            "transfer", "payment", "kyc", "expire", "limited time"
-        ]
-        text_lower = text.lower()
-        matches = sum(1 for keyword in SCAM_KEYWORDS if keyword in text_lower)
+        matches = scan_message(text).count("scam_fallback")
         return matches >= 2
     
-_detector_instance = ScamIntentDetector()
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-text calls into one batched call.
+
+    Callers await ``submit``; texts are collected until ``max_batch`` are
+    waiting or ``max_wait`` seconds have passed since the first one, then
+    ``batch_fn`` runs once on the executor and each caller gets its own
+    result back.
+    """
+
+    def __init__(self, batch_fn, max_batch=SCAM_BATCH_MAX, max_wait=SCAM_BATCH_WAIT_MS / 1000, executor=None):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.executor = executor
+        self.batches = 0
+        self.items = 0
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.items += len(batch)
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self.batch_fn, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+_detector_instance = None
+_detector_lock = threading.Lock()
+
+def get_detector() -> ScamIntentDetector:
+    """Load the models on first use instead of at import time."""
+    global _detector_instance
+    if _detector_instance is None:
+        with _detector_lock:
+            if _detector_instance is None:
+                _detector_instance = ScamIntentDetector()
+    return _detector_instance
+
+def _predict_batch(texts: List[str]) -> List[bool]:
+    return get_detector().predict_many(texts)
+
+_batcher = MicroBatcher(_predict_batch, executor=cpu_executor)
+
+
+def _probability_cache_stats():
+    # Reported once the detector exists; scraping must not load the models.
+    if _detector_instance is None:
+        return None
+    stats = _detector_instance.cache.stats()
+    return {"hit": stats["hits"], "miss": stats["misses"]}
+
+metrics.collect(
+    "honeypot_probability_cache_total", "Scam probability cache lookups by result",
+    _probability_cache_stats, labelnames=("result",)
+)
 
 def detect_scam_intent(message_text: str) -> bool:
-    return _detector_instance.predict(message_text)
\ No newline at end of file
+    return get_detector().predict(message_text)
+
+async def detect_scam_intent_async(message_text: str) -> bool:
+    return await _batcher.submit(message_text)
+
+def classify_texts(texts: List[str], threshold: float = 0.5) -> List[Tuple[float, bool]]:
+    return get_detector().classify(texts, threshold)
\ No newline at end of file
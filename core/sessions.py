@@ -1,22 +1,807 @@
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+
+from core import metrics
+from core.log import get_logger
+from core.workers import run_io
+
+
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "10000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024)))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "3600"))
+
+# "memory" keeps sessions in this process. "sqlite" shares them between
+# uvicorn workers on one host through a WAL-mode database.
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(BASE_DIR, "data", "sessions.db"))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1024"))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+# Set to keep a write-ahead journal of the in-memory store (core/journal.py).
+SESSION_JOURNAL_DIR = os.getenv("SESSION_JOURNAL_DIR")
+# Serialized sessions at least this long are zlib-compressed.
+SESSION_COMPRESS_MIN = 512
+SESSION_SAVE_RETRIES = 3
+
+log = get_logger("sessions")
+
+# Rough per-object overheads used for the memory budget; exact sizes do not
+# matter, only that the estimate grows with what a session actually holds.
+_SESSION_OVERHEAD = 1024
+_MESSAGE_OVERHEAD = 200
+_ITEM_OVERHEAD = 80
+
+
+# The agent never looks further back than this: llm_generate reads the last
+# 10 messages and should_stop the last 6.
+HISTORY_WINDOW = 10
+SESSION_ARCHIVE_DIR = os.getenv("SESSION_ARCHIVE_DIR")
+SESSION_ARCHIVE_FLUSH_INTERVAL = float(os.getenv("SESSION_ARCHIVE_FLUSH_INTERVAL", "0.2"))
+
+ROLE_NAMES = ("assistant", "user")
+ROLE_IDS = {name: i for i, name in enumerate(ROLE_NAMES)}
+
+
+class ArchiveWriter:
+    """Appends transcript lines to archive files from a background thread.
+
+    MessageHistory.append runs on the event loop, so it only queues the
+    line. Every SESSION_ARCHIVE_FLUSH_INTERVAL seconds the writer thread
+    takes whatever has queued up and opens each file once for all of its
+    lines. ``flush`` does the same from the calling thread, e.g. before a
+    transcript is read back.
+    """
+
+    def __init__(self, interval=SESSION_ARCHIVE_FLUSH_INTERVAL):
+        self.interval = interval
+        self._pending = []
+        self._lock = threading.Lock()
+        # Held across take-and-write, so lines reach a file in order.
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    def write(self, path, line):
+        with self._lock:
+            self._pending.append((path, line))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="session-archive", daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            by_path = {}
+            for path, line in pending:
+                by_path.setdefault(path, []).append(line)
+            for path, lines in by_path.items():
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path, "a", encoding="utf-8") as f:
+                        f.write("".join(lines))
+                except OSError:
+                    log.exception("could not write session archive", path=path, lines=len(lines))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+archive_writer = ArchiveWriter()
+atexit.register(archive_writer.flush)
+
+
+class MessageHistory:
+    """Fixed-size ring buffer of the most recent messages.
+
+    Roles are kept as small ints in an ``array('b')`` and texts in a
+    preallocated list, so memory stays flat however long the conversation
+    runs. Reading it yields the same ``{"role", "content"}`` dicts the agent
+    code has always used. When ``archive_path`` is set every message is also
+    appended there, keeping the full transcript on disk for reports.
+    """
+
+    __slots__ = ("capacity", "total", "archive_path", "_roles", "_texts", "_start", "_len")
+
+    def __init__(self, capacity=HISTORY_WINDOW, archive_path=None):
+        self.capacity = capacity
+        self.total = 0
+        self.archive_path = archive_path
+        self._roles = array("b", bytes(capacity))
+        self._texts = [None] * capacity
+        self._start = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for i in range(self._len):
+            slot = (self._start + i) % self.capacity
+            yield {"role": ROLE_NAMES[self._roles[slot]], "content": self._texts[slot]}
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("message index out of range")
+        slot = (self._start + index) % self.capacity
+        return {"role": ROLE_NAMES[self._roles[slot]], "content": self._texts[slot]}
+
+    def append(self, role, content, archive=True):
+        """Add a message and return the text it pushed out of the window, if any."""
+        if archive and self.archive_path:
+            archive_writer.write(self.archive_path, json.dumps({"role": role, "content": content}) + "\n")
+
+        dropped = None
+        if self._len < self.capacity:
+            slot = (self._start + self._len) % self.capacity
+            self._len += 1
+        else:
+            slot = self._start
+            dropped = self._texts[slot]
+            self._start = (self._start + 1) % self.capacity
+        self._roles[slot] = ROLE_IDS[role]
+        self._texts[slot] = content
+        self.total += 1
+        return dropped
+
+    def recent(self, n):
+        return self[-n:] if n < self._len else list(self)
+
+    def last_content(self, role):
+        role_id = ROLE_IDS[role]
+        for i in range(self._len - 1, -1, -1):
+            slot = (self._start + i) % self.capacity
+            if self._roles[slot] == role_id:
+                return self._texts[slot]
+        return ""
+
+    def window(self):
+        """Retained messages as compact ``[role_id, text]`` pairs, oldest first."""
+        return [
+            [self._roles[slot], self._texts[slot]]
+            for slot in ((self._start + i) % self.capacity for i in range(self._len))
+        ]
+
+    @classmethod
+    def restore(cls, window, total, archive_path=None):
+        history = cls(archive_path=archive_path)
+        for role_id, text in window[-history.capacity:]:
+            history._roles[history._len] = role_id
+            history._texts[history._len] = text
+            history._len += 1
+        history.total = total
+        return history
+
+    def transcript(self):
+        """Full conversation when archived, otherwise the retained window."""
+        if self.archive_path:
+            archive_writer.flush()
+        if self.archive_path and os.path.exists(self.archive_path):
+            with open(self.archive_path, encoding="utf-8") as f:
+                return [json.loads(line) for line in f]
+        return list(self)
+
+
+class OrderedSet(list):
+    """Insertion-ordered, duplicate-free list of indicators.
+
+    It is still a list, so it serializes to the same JSON array in the
+    callback payload, but membership checks go through a set and ``add``
+    is O(1) instead of the O(n) ``item not in list`` scan.
+    """
+
+    __slots__ = ("_seen",)
+
+    def __init__(self, items=()):
+        if items:
+            super().__init__(dict.fromkeys(items))
+            self._seen = set(self)
+        else:
+            self._seen = set()
+
+    def __contains__(self, item):
+        return item in self._seen
+
+    def add(self, item):
+        """Append ``item`` unless already present; return True if it was new."""
+        if item in self._seen:
+            return False
+        self._seen.add(item)
+        self.append(item)
+        return True
+
+
+def _archive_path(session_id):
+    if not SESSION_ARCHIVE_DIR:
+        return None
+    name = hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+    return os.path.join(SESSION_ARCHIVE_DIR, name + ".jsonl")
+
+
 class SessionState:
+    __slots__ = (
+        "session_id", "messages", "extracted", "turns", "agent_active",
+        "scamDetected", "finished", "callback_queued", "callback_sent",
+        "last_active", "nbytes", "scammer_messages", "scammer_words",
+        "prompt_state", "version", "base", "history_ts", "intel_first_seen", "intel_last_seen",
+    )
+
+    # Field order of the serialized record; see to_record.
+    INDICATOR_KEYS = ("bankAccounts", "upiIds", "phishingLinks", "phoneNumbers", "suspiciousKeywords")
+    FLAGS = ("agent_active", "scamDetected", "finished", "callback_queued", "callback_sent")
+
     def __init__(self,session_id):
         self.session_id = session_id
-        self.messages = []
-        self.extracted = {"bankAccounts": [],
-    "upiIds": [],
-    "phishingLinks": [],
-    "phoneNumbers": [],
-    "suspiciousKeywords": []
+        self.messages = MessageHistory(archive_path=_archive_path(session_id))
+        self.extracted = {"bankAccounts": OrderedSet(),
+    "upiIds": OrderedSet(),
+    "phishingLinks": OrderedSet(),
+    "phoneNumbers": OrderedSet(),
+    "suspiciousKeywords": OrderedSet()
 }
         self.turns = 0
         self.agent_active = True
         self.scamDetected = False
+        self.finished = False
+        self.callback_queued = False
         self.callback_sent = False
+        self.last_active = time.monotonic()
+        self.nbytes = _SESSION_OVERHEAD + len(session_id)
+        # Running totals over the whole conversation, so notes do not
+        # depend on how much history the ring buffer still holds.
+        self.scammer_messages = 0
+        self.scammer_words = 0
+        # Incremental prompt pieces owned by core.llm_agent.
+        self.prompt_state = None
+        # Version of the stored copy this state was loaded from (0: never
+        # stored), and (messages.total, turns, indicator counts) at that point.
+        self.version = 0
+        self.base = (0, 0, (0,) * len(self.INDICATOR_KEYS))
+        # Timestamp of the newest scammer message taken in, live or from
+        # conversationHistory; older history items are already ingested.
+        self.history_ts = 0
+        # Wall-clock time of the first and latest turn that reported a new
+        # indicator (0: none yet), so a restored session is re-indexed with
+        # its own sightings rather than the restart time.
+        self.intel_first_seen = 0
+        self.intel_last_seen = 0
 
-sessions = {}
+    def add_message(self, role, content, archive=True):
+        dropped = self.messages.append(role, content, archive)
+        if dropped is None:
+            self.nbytes += _MESSAGE_OVERHEAD + len(content)
+        else:
+            self.nbytes += len(content) - len(dropped)
 
-def get_session(session_id):
-    if session_id not in sessions:
-        sessions[session_id] = SessionState(session_id)
-    return sessions[session_id]
+        if role == "assistant":
+            self.scammer_messages += 1
+            self.scammer_words += len(content.split())
+
+    def add_indicator(self, key, item):
+        if not self.extracted[key].add(item):
+            return False
+        self.nbytes += _ITEM_OVERHEAD + len(item)
+        return True
+
+    def note_intel(self, first, last=None):
+        """Widen the indicator sighting span to cover ``first`` .. ``last``."""
+        if not self.intel_first_seen or first < self.intel_first_seen:
+            self.intel_first_seen = first
+        self.intel_last_seen = max(self.intel_last_seen, first if last is None else last)
+
+    def mark_stored(self):
+        self.base = (
+            self.messages.total, self.turns,
+            tuple(len(self.extracted[key]) for key in self.INDICATOR_KEYS),
+        )
+
+    def flag_bits(self):
+        flags = 0
+        for bit, name in enumerate(self.FLAGS):
+            if getattr(self, name):
+                flags |= 1 << bit
+        return flags
+
+    def set_flag_bits(self, flags):
+        for bit, name in enumerate(self.FLAGS):
+            setattr(self, name, bool(flags & (1 << bit)))
+
+    def delta(self):
+        """What changed since ``base``, as a compact positional list.
+
+        Counters and flags are absolute values; messages and indicators are
+        only the new ones. See apply_delta.
+        """
+        new_messages = self.messages.total - self.base[0]
+        window = self.messages.window()
+        indicators = [
+            [k, item]
+            for k, key in enumerate(self.INDICATOR_KEYS)
+            for item in self.extracted[key][self.base[2][k]:]
+        ]
+        return [
+            self.session_id, self.turns, self.flag_bits(), self.scammer_messages, self.scammer_words,
+            self.messages.total, window[len(window) - min(new_messages, len(window)):], indicators,
+            self.history_ts, self.intel_first_seen, self.intel_last_seen,
+        ]
+
+    def apply_delta(self, delta):
+        """Replay a ``delta`` record; applying the same record twice is harmless."""
+        _, turns, flags, scammer_messages, scammer_words, total, messages, indicators = delta[:8]
+        first = total - len(messages)
+        for offset, (role_id, text) in enumerate(messages):
+            if first + offset >= self.messages.total:
+                self.add_message(ROLE_NAMES[role_id], text, archive=False)
+        self.messages.total = max(self.messages.total, total)
+        for k, item in indicators:
+            self.add_indicator(self.INDICATOR_KEYS[k], item)
+        self.turns = turns
+        self.set_flag_bits(flags)
+        self.scammer_messages = scammer_messages
+        self.scammer_words = scammer_words
+        if len(delta) > 8:
+            self.history_ts = max(self.history_ts, delta[8])
+        if len(delta) > 10 and delta[9]:
+            self.note_intel(delta[9], delta[10])
+
+    def to_record(self, compress=True):
+        """Compact serialized form: a positional JSON array, zlib'd when large.
+
+        The prompt state and local timestamps are not stored; the prompt
+        state is rebuilt from the message window when needed.
+        """
+        data = json.dumps([
+            1, self.session_id, self.turns, self.flag_bits(), self.scammer_messages, self.scammer_words,
+            self.messages.total, self.messages.window(),
+            [list(self.extracted[key]) for key in self.INDICATOR_KEYS], self.history_ts,
+            self.intel_first_seen, self.intel_last_seen,
+        ], separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        if compress and len(data) >= SESSION_COMPRESS_MIN:
+            return zlib.compress(data, 1)
+        return data
+
+    @classmethod
+    def from_record(cls, data, version):
+        if data[:1] != b"[":
+            data = zlib.decompress(data)
+        fields = json.loads(data)
+        _, session_id, turns, flags, scammer_messages, scammer_words, total, window, indicators = fields[:9]
+
+        session = cls(session_id)
+        session.turns = turns
+        session.set_flag_bits(flags)
+        session.scammer_messages = scammer_messages
+        session.scammer_words = scammer_words
+        session.messages = MessageHistory.restore(window, total, session.messages.archive_path)
+        session.nbytes += sum(_MESSAGE_OVERHEAD + len(text) for _, text in window)
+        for key, items in zip(cls.INDICATOR_KEYS, indicators):
+            session.extracted[key] = OrderedSet(items)
+            session.nbytes += sum(_ITEM_OVERHEAD + len(item) for item in items)
+        if len(fields) > 9:
+            session.history_ts = fields[9]
+        if len(fields) > 11:
+            session.intel_first_seen, session.intel_last_seen = fields[10:12]
+        session.version = version
+        session.mark_stored()
+        return session
+
+    def absorb(self, stale):
+        """Apply the changes ``stale`` made since it was loaded on top of this newer state.
+
+        Used when another worker saved the session in the meantime: this
+        turn's messages, turn count and indicators are added, and the
+        one-way flags are carried over.
+        """
+        new_messages = stale.messages.total - stale.base[0]
+        if new_messages > 0:
+            for msg in stale.messages.recent(new_messages):
+                # Archived already, when the stale copy first added them.
+                self.add_message(msg["role"], msg["content"], archive=False)
+        self.turns += stale.turns - stale.base[1]
+        self.history_ts = max(self.history_ts, stale.history_ts)
+        if stale.intel_first_seen:
+            self.note_intel(stale.intel_first_seen, stale.intel_last_seen)
+        for key, items in stale.extracted.items():
+            for item in items:
+                self.add_indicator(key, item)
+        for name in self.FLAGS[1:]:
+            if getattr(stale, name):
+                setattr(self, name, True)
 
+
+class SessionStore:
+    """Bounded session map with idle-TTL expiry and LRU eviction.
+
+    Sessions are kept in an OrderedDict in least-recently-used order, so a
+    lookup is O(1) and eviction only ever pops from the front. Every session
+    is removed at most once, which keeps eviction amortized O(1) per request.
+    ``on_evict`` is called for finished sessions whose GUVI callback has not
+    been confirmed yet, so their results are not silently dropped.
+
+    With a ``journal`` (core.journal.SessionJournal) every save appends the
+    turn's changes to it, so the store can be rebuilt after a restart.
+    """
+
+    # Nothing here waits on I/O (the journal is written by its own thread).
+    blocking = False
+
+    def __init__(self, max_sessions=SESSION_MAX_COUNT, max_bytes=SESSION_MAX_BYTES,
+                 idle_ttl=SESSION_IDLE_TTL, on_evict=None, journal=None):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.on_evict = on_evict
+        self.journal = journal
+        self.evictions = 0
+        self.expirations = 0
+
+        self._sessions = OrderedDict()
+        self._accounted = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def __getitem__(self, session_id):
+        return self._sessions[session_id]
+
+    def get(self, session_id, default=None):
+        return self._sessions.get(session_id, default)
+
+    async def get_async(self, session_id):
+        return self.get(session_id)
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def get_session(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = SessionState(session_id)
+                self._sessions[session_id] = session
+                self._accounted[session_id] = 0
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_active = now
+
+            # Sessions grow while a turn is processed; settle the estimate
+            # from the previous turn now that the session is touched again.
+            self._total_bytes += session.nbytes - self._accounted[session_id]
+            self._accounted[session_id] = session.nbytes
+
+            pending = self._evict(now, keep=session)
+
+        for evicted in pending:
+            self.on_evict(evicted)
+        return session
+
+    async def get_session_async(self, session_id):
+        return self.get_session(session_id)
+
+    def save(self, session):
+        """Journal the changes since the last save, if there is a journal."""
+        if self.journal is not None:
+            self.journal.append(session.delta())
+            session.mark_stored()
+        return session
+
+    async def save_async(self, session):
+        return self.save(session)
+
+    def put(self, session):
+        """Insert or replace a session, e.g. one rebuilt from the journal."""
+        with self._lock:
+            session.last_active = time.monotonic()
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            self._total_bytes += session.nbytes - self._accounted.get(session.session_id, 0)
+            self._accounted[session.session_id] = session.nbytes
+
+    def discard(self, session_id):
+        with self._lock:
+            if self._sessions.pop(session_id, None) is not None:
+                self._total_bytes -= self._accounted.pop(session_id)
+
+    def enforce_limits(self):
+        """Evict down to the count, byte and idle limits (after bulk ``put``)."""
+        with self._lock:
+            pending = self._evict(time.monotonic(), keep=None)
+        for evicted in pending:
+            self.on_evict(evicted)
+
+    def session_ids(self):
+        with self._lock:
+            return list(self._sessions)
+
+    def _evict(self, now, keep):
+        pending = []
+        while self._sessions:
+            session_id, oldest = next(iter(self._sessions.items()))
+            if oldest is keep:
+                break
+
+            expired = now - oldest.last_active > self.idle_ttl
+            over_budget = (
+                len(self._sessions) > self.max_sessions
+                or self._total_bytes > self.max_bytes
+            )
+            if not (expired or over_budget):
+                break
+
+            del self._sessions[session_id]
+            self._total_bytes -= self._accounted.pop(session_id)
+            if self.journal is not None:
+                self.journal.forget(session_id)
+            if expired:
+                self.expirations += 1
+            else:
+                self.evictions += 1
+
+            if self.on_evict and oldest.finished and not oldest.callback_sent:
+                pending.append(oldest)
+        return pending
+
+
+class SqliteSessionStore:
+    """Sessions in a WAL-mode SQLite file, shared by every worker on the host.
+
+    Each row holds a session's compact record and a version number. A save
+    only succeeds against the version it was loaded from. If another worker
+    saved first, this turn's changes are merged into the newer state
+    (``SessionState.absorb``) and the save is retried.
+
+    Recently used sessions are also kept deserialized in a small per-process
+    cache. ``get_session`` first checks the stored version, and only fetches
+    and decodes the record when another worker has changed it.
+
+    Rows idle for longer than ``idle_ttl`` are swept out. As with the
+    in-memory store, ``on_evict`` sees finished sessions whose callback was
+    not confirmed.
+
+    Queries can wait up to the busy timeout on another worker's write, so
+    code on the event loop uses the ``*_async`` methods, which run them on
+    the I/O pool (core.workers.run_io).
+    """
+
+    # Every save is already durable; there is nothing to journal.
+    journal = None
+    blocking = True
+
+    def __init__(self, path=SESSION_DB_PATH, idle_ttl=SESSION_IDLE_TTL,
+                 cache_size=SESSION_CACHE_SIZE, on_evict=None):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.cache_size = cache_size
+        self.on_evict = on_evict
+        self.evictions = 0
+        self.expirations = 0
+        self.conflicts = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                data BLOB NOT NULL
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at)")
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._next_sweep = time.monotonic() + SESSION_SWEEP_INTERVAL
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+    def __getitem__(self, session_id):
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            pages = self._db.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+        return pages * page_size
+
+    def get(self, session_id, default=None):
+        session = self._load(session_id)
+        return default if session is None else session
+
+    async def get_async(self, session_id):
+        return await run_io(self._load, session_id)
+
+    def get_session(self, session_id):
+        session = self._load(session_id)
+        if session is None:
+            session = SessionState(session_id)
+            self._remember(session)
+        session.last_active = time.monotonic()
+        return session
+
+    async def get_session_async(self, session_id):
+        return await run_io(self.get_session, session_id)
+
+    def _load(self, session_id):
+        with self._cache_lock:
+            cached = self._cache.get(session_id)
+        known = cached.version if cached is not None else -1
+        with self._lock:
+            # Ship the record only if it differs from the cached copy.
+            row = self._db.execute(
+                "SELECT version, CASE WHEN version != ? THEN data END FROM sessions WHERE id = ?",
+                (known, session_id),
+            ).fetchone()
+        if row is None:
+            # Not stored yet; a cached copy is a session created here whose
+            # first turn has not been saved.
+            return cached if cached is not None and cached.version == 0 else None
+        version, data = row
+        if data is None:
+            with self._cache_lock:
+                if session_id in self._cache:
+                    self._cache.move_to_end(session_id)
+            return cached
+        session = SessionState.from_record(data, version)
+        self._remember(session)
+        return session
+
+    def _remember(self, session):
+        with self._cache_lock:
+            self._cache[session.session_id] = session
+            self._cache.move_to_end(session.session_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+
+    def save(self, session):
+        """Store ``session`` and return the state that was stored.
+
+        That is ``session`` itself unless another worker got there first,
+        in which case it is the newer stored state with this turn merged in.
+        """
+        for _ in range(SESSION_SAVE_RETRIES):
+            if self._write(session.session_id, session.version, session.to_record()):
+                self._stored(session)
+                self._maybe_sweep()
+                return session
+            session = self._merge_into_latest(session, self.get(session.session_id))
+        log.error("session not saved after repeated conflicts", session_id=session.session_id)
+        return session
+
+    async def save_async(self, session):
+        """``save`` with the queries on the I/O pool.
+
+        Encoding and merging stay on the calling thread: another turn on the
+        loop may be holding the same cached session.
+        """
+        for _ in range(SESSION_SAVE_RETRIES):
+            if await run_io(self._write, session.session_id, session.version, session.to_record()):
+                self._stored(session)
+                if time.monotonic() >= self._next_sweep:
+                    await run_io(self._maybe_sweep)
+                return session
+            session = self._merge_into_latest(session, await self.get_async(session.session_id))
+        log.error("session not saved after repeated conflicts", session_id=session.session_id)
+        return session
+
+    def _stored(self, session):
+        session.version += 1
+        session.mark_stored()
+        self._remember(session)
+
+    def _merge_into_latest(self, session, latest):
+        self.conflicts += 1
+        if latest is None:
+            # Swept out underneath us; store ours as a fresh session.
+            session.version = 0
+            return session
+        log.info("session changed by another worker, merging turn",
+                 session_id=session.session_id, version=latest.version)
+        latest.absorb(session)
+        latest.prompt_state = session.prompt_state
+        return latest
+
+    def _write(self, session_id, version, data):
+        now = time.time()
+        with self._lock:
+            if version == 0:
+                cursor = self._db.execute(
+                    "INSERT INTO sessions (id, version, updated_at, data) VALUES (?, 1, ?, ?) "
+                    "ON CONFLICT(id) DO NOTHING",
+                    (session_id, now, data),
+                )
+            else:
+                cursor = self._db.execute(
+                    "UPDATE sessions SET version = version + 1, updated_at = ?, data = ? "
+                    "WHERE id = ? AND version = ?",
+                    (now, data, session_id, version),
+                )
+        return cursor.rowcount == 1
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        with self._cache_lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + SESSION_SWEEP_INTERVAL
+        cutoff = time.time() - self.idle_ttl
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, version, data FROM sessions WHERE updated_at < ?", (cutoff,)
+            ).fetchall()
+            self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+        self.expirations += len(rows)
+        with self._cache_lock:
+            for session_id, _, _ in rows:
+                self._cache.pop(session_id, None)
+        for session_id, version, data in rows:
+            if self.on_evict:
+                session = SessionState.from_record(data, version)
+                if session.finished and not session.callback_sent:
+                    self.on_evict(session)
+
+
+def create_session_store(backend=SESSION_BACKEND):
+    if backend == "sqlite":
+        return SqliteSessionStore()
+    if backend != "memory":
+        raise ValueError(f"Unknown SESSION_BACKEND {backend!r}; use 'memory' or 'sqlite'")
+    journal = None
+    if SESSION_JOURNAL_DIR:
+        from core.journal import SessionJournal
+        journal = SessionJournal(SESSION_JOURNAL_DIR)
+    return SessionStore(journal=journal)
+
+
+sessions = create_session_store()
+
+metrics.collect(
+    "honeypot_active_sessions", "Sessions held in memory",
+    lambda: {(): len(sessions)}, kind="gauge"
+)
+metrics.collect(
+    "honeypot_session_bytes", "Estimated memory held by sessions",
+    lambda: {(): sessions.total_bytes}, kind="gauge"
+)
+metrics.collect(
+    "honeypot_sessions_removed_total", "Sessions dropped from memory, by reason",
+    lambda: {"evicted": sessions.evictions, "expired": sessions.expirations},
+    labelnames=("reason",)
+)
+
+def get_session(session_id):
+    return sessions.get_session(session_id)
@@ -0,0 +1,91 @@
+"""In-process stand-ins for the google-genai client and the callback, for offline runs.
+
+Install with ``core.llm_agent.set_client(StubGenaiClient())``. Every call is
+recorded so benchmarks can look at what would have been sent upstream.
+"""
+import asyncio
+import itertools
+
+
+STUB_REPLIES = [
+    "hmm wait which account you are talking about, i'm scared",
+    "sir link not opening on my phone, can you send again",
+    "ok i am trying but why all this? give me your number",
+    "getting error page only, which upi id i should use",
+]
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubCache:
+    def __init__(self, name):
+        self.name = name
+
+
+class _StubModels:
+    def __init__(self, client):
+        self._client = client
+
+    async def generate_content(self, model, contents, config=None):
+        self._client.calls.append({
+            "model": model,
+            "contents": contents,
+            "chars": len(contents),
+            "cached_content": getattr(config, "cached_content", None),
+        })
+        if self._client.latency:
+            await asyncio.sleep(self._client.latency)
+        return StubResponse(next(self._client._replies))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        response = await self.generate_content(model, contents, config)
+        words = response.text.split(" ")
+
+        async def chunks():
+            for i in range(0, len(words), 2):
+                yield StubResponse(" ".join(words[i:i + 2]) + " ")
+
+        return chunks()
+
+
+class _StubCaches:
+    def __init__(self, client):
+        self._client = client
+
+    async def create(self, model, config=None):
+        self._client.caches_created += 1
+        return StubCache(f"cachedContents/stub-{self._client.caches_created}")
+
+
+class _StubAio:
+    def __init__(self, client):
+        self.models = _StubModels(client)
+        self.caches = _StubCaches(client)
+
+
+class StubGenaiClient:
+    def __init__(self, replies=STUB_REPLIES, latency=0.0):
+        self.calls = []
+        self.caches_created = 0
+        self.latency = latency
+        self._replies = itertools.cycle(replies)
+        self.aio = _StubAio(self)
+
+
+class StubCallback:
+    """Drop-in for tools.callback.send_guvi_callback that records payloads.
+
+    The payload is still built, so its cost stays in anything timed, but
+    nothing is written to the outbox or sent over the network.
+    """
+
+    def __init__(self):
+        self.payloads = []
+
+    def __call__(self, session):
+        from tools.callback import build_callback_payload
+        self.payloads.append(build_callback_payload(session))
+        session.callback_queued = True
@@ -1,3 +1,5 @@
+import asyncio
+
 from core.flow import handle_message
 from core.sessions import sessions
 
@@ -12,7 +14,7 @@ scammer_messages = [
 ]
 
 for msg in scammer_messages:
-    reply, stop_flag = handle_message(session_id, msg)
+    reply, stop_flag = asyncio.run(handle_message(session_id, msg))
 
     print("\nScammer:", msg)
     print("Agent  :", reply)
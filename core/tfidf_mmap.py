@@ -0,0 +1,254 @@
+"""Memory-mapped TF-IDF vocabulary shared by every worker process.
+
+A pickled ``TfidfVectorizer`` keeps its vocabulary as a large str -> int
+dict, and each uvicorn worker unpickles a private copy. ``export`` writes
+the fitted state into one flat file instead: an open-addressing hash
+table of term ids, the UTF-8 term bytes, their offsets and the IDF array.
+``MmapTfidfVectorizer`` maps that file read-only, so all workers share the
+same physical pages, and produces the same sparse output as
+``vectorizer.transform``.
+
+    python -m core.tfidf_mmap export [--vectorizer PKL] [--out FILE]
+    python -m core.tfidf_mmap verify [--vectorizer PKL] [--mmap FILE] TEXT...
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+
+MAGIC = b"NYTFIDF1"
+_HEADER_LEN = struct.Struct("<I")
+_ALIGN = 64
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_VECTORIZER_PATH = os.path.join(BASE_DIR, "models", "tfidf_vectorizer.pkl")
+DEFAULT_MMAP_PATH = os.path.join(BASE_DIR, "models", "tfidf_vectorizer.mmap")
+TERM_CACHE_SIZE = int(os.getenv("TFIDF_TERM_CACHE_SIZE", "20000"))
+
+# Fitted-state parameters that only matter while fitting, or that we store
+# separately.
+_SKIPPED_PARAMS = {"vocabulary", "dtype", "max_df", "min_df", "max_features"}
+
+
+def _term_hash(term_bytes):
+    return zlib.crc32(term_bytes)
+
+
+def export(vectorizer, path, idf_dtype="float64"):
+    """Write a fitted TfidfVectorizer to ``path`` in the mmap format.
+
+    The IDF array is stored as float64 by default so the output matches
+    ``vectorizer.transform`` exactly; float32 halves it at the cost of
+    ~1e-7 relative error.
+    """
+    params = {}
+    for key, value in vectorizer.get_params().items():
+        if key in _SKIPPED_PARAMS:
+            continue
+        if callable(value):
+            raise ValueError(f"Cannot export vectorizer with a callable {key!r}")
+        params[key] = list(value) if isinstance(value, (tuple, frozenset, set)) else value
+
+    vocabulary = vectorizer.vocabulary_
+    n_terms = len(vocabulary)
+    terms = [None] * n_terms
+    for term, index in vocabulary.items():
+        terms[index] = term.encode("utf-8")
+
+    offsets = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum([len(t) for t in terms], out=offsets[1:])
+    blob = b"".join(terms)
+
+    table_size = 1
+    while table_size < 2 * n_terms:
+        table_size *= 2
+    mask = table_size - 1
+    table = np.full(table_size, -1, dtype=np.int32)
+    for index, term in enumerate(terms):
+        slot = _term_hash(term) & mask
+        while table[slot] != -1:
+            slot = (slot + 1) & mask
+        table[slot] = index
+
+    idf = np.asarray(vectorizer.idf_, dtype=idf_dtype) if vectorizer.use_idf else np.ones(n_terms, dtype=idf_dtype)
+    arrays = [("table", table), ("offsets", offsets), ("idf", idf), ("blob", np.frombuffer(blob, dtype=np.uint8))]
+
+    header = {
+        "params": params,
+        "dtype": np.dtype(vectorizer.dtype).name,
+        "n_terms": n_terms,
+        "arrays": {},
+    }
+    # Array offsets depend on the header length and vice versa; lay out
+    # until the header stops changing size.
+    header_bytes = b""
+    while True:
+        position = len(MAGIC) + _HEADER_LEN.size + len(header_bytes)
+        for name, array in arrays:
+            position = -(-position // _ALIGN) * _ALIGN
+            header["arrays"][name] = {"offset": position, "dtype": array.dtype.str, "length": len(array)}
+            position += array.nbytes
+        encoded = json.dumps(header).encode("utf-8")
+        if len(encoded) == len(header_bytes):
+            header_bytes = encoded
+            break
+        header_bytes = encoded
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_HEADER_LEN.pack(len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays:
+            padding = header["arrays"][name]["offset"] - f.tell()
+            assert padding >= 0, "array offsets overlap the header"
+            f.write(b"\0" * padding)
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+
+
+class MmapTfidfVectorizer:
+    """Read-only TF-IDF transformer backed by a memory-mapped export."""
+
+    def __init__(self, path=DEFAULT_MMAP_PATH):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a TF-IDF mmap export")
+        (header_len,) = _HEADER_LEN.unpack_from(self._mmap, len(MAGIC))
+        start = len(MAGIC) + _HEADER_LEN.size
+        header = json.loads(self._mmap[start:start + header_len].decode("utf-8"))
+
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            arrays[name] = np.frombuffer(self._mmap, dtype=np.dtype(spec["dtype"]),
+                                         count=spec["length"], offset=spec["offset"])
+        self._table = arrays["table"]
+        self._mask = len(self._table) - 1
+        self._offsets = arrays["offsets"]
+        self._blob = memoryview(self._mmap)[header["arrays"]["blob"]["offset"]:][:header["arrays"]["blob"]["length"]]
+        self.idf_ = arrays["idf"]
+
+        params = header["params"]
+        if "ngram_range" in params:
+            params["ngram_range"] = tuple(params["ngram_range"])
+        # An unfitted vectorizer with the same settings gives us the exact
+        # same analyzer (lowercasing, token pattern, stop words, n-grams).
+        self._analyzer = TfidfVectorizer(**params).build_analyzer()
+        self.norm = params.get("norm", "l2")
+        self.sublinear_tf = params.get("sublinear_tf", False)
+        self.binary = params.get("binary", False)
+        self.dtype = np.dtype(header["dtype"])
+        self.n_features = header["n_terms"]
+        self._lookup = lru_cache(maxsize=TERM_CACHE_SIZE)(self._lookup_uncached)
+
+    def _lookup_uncached(self, term):
+        term_bytes = term.encode("utf-8")
+        slot = _term_hash(term_bytes) & self._mask
+        while True:
+            index = int(self._table[slot])
+            if index < 0:
+                return -1
+            start, end = self._offsets[index], self._offsets[index + 1]
+            if self._blob[start:end] == term_bytes:
+                return index
+            slot = (slot + 1) & self._mask
+
+    def transform(self, texts):
+        from scipy.sparse import csr_matrix
+
+        indptr = [0]
+        indices = []
+        counts = []
+        for text in texts:
+            row = {}
+            for term in self._analyzer(text):
+                index = self._lookup(term)
+                if index >= 0:
+                    row[index] = row.get(index, 0) + 1
+            for index in sorted(row):
+                indices.append(index)
+                counts.append(row[index])
+            indptr.append(len(indices))
+
+        indices = np.asarray(indices, dtype=np.int32)
+        indptr = np.asarray(indptr, dtype=np.int32)
+        data = np.asarray(counts, dtype=self.dtype)
+        if self.binary:
+            data[:] = 1
+        if self.sublinear_tf:
+            np.log(data, out=data)
+            data += 1
+        data *= self.idf_[indices]
+
+        if self.norm == "l2" or self.norm == "l1":
+            values = data * data if self.norm == "l2" else np.abs(data)
+            for i in range(len(indptr) - 1):
+                start, end = indptr[i], indptr[i + 1]
+                if start == end:
+                    continue
+                total = values[start:end].sum()
+                if self.norm == "l2":
+                    total = np.sqrt(total)
+                if total != 0:
+                    data[start:end] /= total
+
+        return csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, self.n_features), dtype=self.dtype)
+
+
+def _load_pickled(path):
+    import joblib
+    return joblib.load(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or verify the memory-mapped TF-IDF vocabulary")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = sub.add_parser("export")
+    export_cmd.add_argument("--vectorizer", default=DEFAULT_VECTORIZER_PATH)
+    export_cmd.add_argument("--out", default=DEFAULT_MMAP_PATH)
+    export_cmd.add_argument("--idf-dtype", default="float64", choices=["float64", "float32"])
+
+    verify_cmd = sub.add_parser("verify")
+    verify_cmd.add_argument("--vectorizer", default=DEFAULT_VECTORIZER_PATH)
+    verify_cmd.add_argument("--mmap", default=DEFAULT_MMAP_PATH)
+    verify_cmd.add_argument("texts", nargs="*", default=[
+        "Your account is blocked urgently verify",
+        "Send money to UPI: fraudster@upi",
+        "Payment link is http://fakebank.xyz/pay",
+        "Call me at +919876543210",
+        "hi, are we still meeting for lunch tomorrow?",
+    ])
+
+    args = parser.parse_args()
+    vectorizer = _load_pickled(args.vectorizer)
+
+    if args.command == "export":
+        export(vectorizer, args.out, idf_dtype=args.idf_dtype)
+        print(f"Exported {len(vectorizer.vocabulary_)} terms to {args.out} ({os.path.getsize(args.out)} bytes)")
+        return
+
+    expected = vectorizer.transform(args.texts)
+    actual = MmapTfidfVectorizer(args.mmap).transform(args.texts)
+    same_structure = (
+        np.array_equal(expected.indptr, actual.indptr)
+        and np.array_equal(expected.indices, actual.indices)
+    )
+    max_diff = float(np.abs(expected.data - actual.data).max()) if expected.nnz else 0.0
+    print(f"structure identical: {same_structure}, max abs difference: {max_diff:.3g}")
+    if not same_structure or max_diff > 1e-12:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Detection and extraction are CPU-bound; run them off the event loop so a
+# single worker can keep many conversations in flight while Gemini is slow.
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="honeypot-cpu")
+
+
+async def run_cpu(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor, func, *args)
+
+
+# Session store reads and writes can wait on SQLite locks held by other
+# uvicorn workers; they get their own threads so a busy database never
+# holds up the event loop or the CPU-bound work above.
+IO_WORKERS = int(os.getenv("IO_WORKERS", "2"))
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="honeypot-io")
+
+
+async def run_io(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, func, *args)
@@ -0,0 +1,54 @@
+from collections import Counter
+
+from core.agent import FALLBACK, RULES, choose_goal, missing_mask, set_policy_seed
+from core.extractor import scan_message
+from core.sessions import SessionState
+
+
+def session_with(session_id, text, turns=5, held=()):
+    session = SessionState(session_id)
+    session.turns = turns
+    for key in held:
+        session.add_indicator(key, "x")
+    session.add_message("assistant", text)
+    return session
+
+
+def test_tables_cover_every_missing_mask():
+    assert len(FALLBACK) == 16
+    assert all(len(rule[4]) == 16 for rule in RULES)
+    assert missing_mask(SessionState("m").extracted) == 0b1111
+
+
+def test_goals_replay_for_the_same_seed():
+    sessions = [session_with(f"s{i}", "Please confirm the OTP sir") for i in range(50)]
+    set_policy_seed(7)
+    first = [choose_goal(session) for session in sessions]
+    set_policy_seed(7)
+    assert [choose_goal(session) for session in sessions] == first
+    set_policy_seed(8)
+    assert [choose_goal(session) for session in sessions] != first
+
+
+def test_providing_a_held_upi_with_nothing_missing_reports_it_broken():
+    held = ("upiIds", "phishingLinks", "phoneNumbers", "bankAccounts")
+    for i in range(20):
+        assert choose_goal(session_with(f"u{i}", "pay to fraud@ybl", held=held)) == "upi_not_working"
+
+
+def test_early_turns_without_an_intent_stall():
+    assert choose_goal(session_with("early", "hello", turns=1)) == "stall"
+
+
+def test_confirmation_goal_frequencies():
+    # asking_confirmation with all four indicators missing: each ask goal
+    # 0.6 / 4, then stall 0.4 * 0.7 and reassure 0.4 * 0.3.
+    set_policy_seed(0)
+    scan = scan_message("Please confirm the OTP sir")
+    n = 20000
+    counts = Counter(choose_goal(session_with(f"c{i}", "Please confirm the OTP sir"), scan) for i in range(n))
+    expected = {"ask_for_phishing_link": 0.15, "ask_for_upi": 0.15, "ask_for_phone": 0.15,
+                "ask_for_bank_account": 0.15, "stall": 0.28, "reassure": 0.12}
+    assert set(counts) == set(expected)
+    for goal, share in expected.items():
+        assert abs(counts[goal] / n - share) < 0.015
@@ -0,0 +1,45 @@
+import gzip
+import json
+
+from tools.analyze_corpus import analyze_chunk, read_chunks
+
+
+def write_jsonl(path, rows, opener=open):
+    with opener(path, "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+
+
+def test_jsonl_ids_above_2_53_survive_a_null(tmp_path):
+    path = tmp_path / "dump.jsonl"
+    write_jsonl(path, [
+        {"id": 1152921504606846977, "text": "a"},
+        {"id": None, "text": "b"},
+        {"text": "c"},
+        {"id": 9007199254740993, "text": None},
+    ])
+
+    chunks = list(read_chunks(str(path), "jsonl", "text", "id", 3))
+
+    assert chunks == [
+        ([1152921504606846977, None, None], ["a", "b", "c"]),
+        ([9007199254740993], [""]),
+    ]
+
+
+def test_jsonl_compressed_input(tmp_path):
+    path = tmp_path / "dump.jsonl.gz"
+    write_jsonl(path, [{"id": "x", "text": "hello"}], opener=gzip.open)
+
+    assert list(read_chunks(str(path), "jsonl", "text", "id", 10)) == [(["x"], ["hello"])]
+
+
+def test_analyze_chunk_writes_exact_ids_and_null(monkeypatch):
+    class Detector:
+        def classify(self, texts, threshold):
+            return [(0.0, False) for _ in texts]
+
+    monkeypatch.setattr("core.scam_intent.get_detector", lambda: Detector())
+    _, _, encoded = analyze_chunk([1152921504606846977, None], ["a", "b"], 0.5, False, "jsonl")
+
+    assert [json.loads(line)["id"] for line in encoded.splitlines()] == [1152921504606846977, None]
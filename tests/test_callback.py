@@ -0,0 +1,35 @@
+import asyncio
+import threading
+
+import tools.callback as callback
+from core.sessions import sessions
+
+
+def test_delivery_reported_before_startup_waits_for_the_loop(monkeypatch):
+    monkeypatch.setattr(callback, "_loop", None)
+    monkeypatch.setattr(callback, "_early_deliveries", [])
+    session = sessions.get_session("early-delivery")
+    sessions.save(session)
+
+    # The outbox drains rows from a previous process before any request.
+    worker = threading.Thread(target=callback._mark_delivered, args=("early-delivery",))
+    worker.start()
+    worker.join()
+    assert not sessions.get("early-delivery").callback_sent
+
+    applied_on = []
+    original = callback._apply_delivered
+
+    def record(session_id):
+        applied_on.append(threading.current_thread())
+        original(session_id)
+
+    monkeypatch.setattr(callback, "_apply_delivered", record)
+
+    async def startup():
+        callback.bind_event_loop(asyncio.get_running_loop())
+        await asyncio.sleep(0)
+
+    asyncio.run(startup())
+    assert applied_on == [threading.main_thread()]
+    assert sessions.get("early-delivery").callback_sent
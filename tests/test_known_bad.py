@@ -0,0 +1,42 @@
+from core.known_bad import KnownBadIndicators
+
+UPI = {"upiIds": ["fraud@ybl"]}
+OTHER_UPI = {"upiIds": ["other@ybl"]}
+
+
+def make(path):
+    # A long interval: the tests drive refresh() themselves.
+    return KnownBadIndicators(str(path), capacity=1000, check_interval=3600)
+
+
+def test_concurrent_workers_keep_each_others_additions(tmp_path):
+    path = tmp_path / "known_bad.bloom"
+    first, second = make(path), make(path)
+    first.add([("upiIds", "fraud@ybl")])
+    second.add([("upiIds", "other@ybl")])
+
+    fresh = make(path)
+    fresh.refresh()
+    assert fresh.match(UPI) == ("upiIds", "fraud@ybl")
+    assert fresh.match(OTHER_UPI) == ("upiIds", "other@ybl")
+    fresh.stop()
+
+
+def test_refresh_picks_up_another_workers_addition(tmp_path):
+    path = tmp_path / "known_bad.bloom"
+    reader, writer = make(path), make(path)
+    writer.add([("upiIds", "fraud@ybl")])
+    assert reader.bloom is None
+
+    reader.refresh()
+    assert reader.match(UPI) is not None
+    reader.stop()
+
+
+def test_match_does_not_wait_for_an_add_in_progress(tmp_path):
+    known_bad = make(tmp_path / "known_bad.bloom")
+    known_bad.add([("upiIds", "fraud@ybl")])
+    # add() holds this lock across its file I/O.
+    with known_bad._io_lock:
+        assert known_bad.match(UPI) == ("upiIds", "fraud@ybl")
+    known_bad.stop()
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from core import llm_agent
+from core.llm_agent import PersonaCache, PROMPT_RECENT_MESSAGES, STATIC_INSTRUCTIONS, llm_generate, llm_stream
+from core.sessions import SessionState
+from core.stubs import STUB_REPLIES, StubGenaiClient
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = StubGenaiClient()
+    monkeypatch.setattr(llm_agent, "_client", client)
+    monkeypatch.setattr(llm_agent, "persona_cache", PersonaCache(enabled=False))
+    return client
+
+
+def conversation(session_id, turns):
+    session = SessionState(session_id)
+    for i in range(turns):
+        session.add_message("assistant", f"scammer line {i}: your account is blocked")
+        session.add_message("user", f"rajesh line {i}: why sir?")
+    return session
+
+
+async def collect(stream):
+    return [piece async for piece in stream]
+
+
+def test_generate_returns_the_model_reply(client):
+    session = conversation("gen", 2)
+    reply = asyncio.run(llm_generate("stall", session.messages, session=session))
+
+    assert reply == STUB_REPLIES[0]
+    [call] = client.calls
+    assert "scammer line 1: your account is blocked" in call["contents"]
+    assert STATIC_INSTRUCTIONS in call["contents"]
+    assert call["cached_content"] is None
+
+
+def test_stream_yields_the_model_reply_in_pieces(client):
+    session = conversation("stream", 2)
+    pieces = asyncio.run(collect(llm_stream("stall", session.messages, session=session)))
+
+    assert len(pieces) > 1
+    assert "".join(pieces).strip() == STUB_REPLIES[0]
+    assert len(client.calls) == 1
+
+
+def test_prompt_state_is_reused_and_only_takes_new_turns(client):
+    session = conversation("state", 5)
+    asyncio.run(llm_generate("stall", session.messages, session=session))
+    state = session.prompt_state
+    assert state.ingested == session.messages.total == 10
+
+    session.add_message("assistant", "scammer line 5: send otp now")
+    asyncio.run(llm_generate("stall", session.messages, session=session))
+
+    assert session.prompt_state is state
+    assert state.ingested == 11
+    assert len(state.recent) == PROMPT_RECENT_MESSAGES
+    assert state.recent[-1] == "Bank Rep: scammer line 5: send otp now"
+    assert "scammer line 5: send otp now" in client.calls[-1]["contents"]
+
+
+def test_persona_cache_is_created_once_and_replaces_the_inline_prefix(client, monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(llm_agent, "persona_cache", PersonaCache(enabled=True))
+        session = conversation("cached", 1)
+        await llm_generate("stall", session.messages, session=session)
+        await llm_generate("stall", session.messages, session=session)
+
+    asyncio.run(scenario())
+
+    assert client.caches_created == 1
+    assert [call["cached_content"] for call in client.calls] == ["cachedContents/stub-1"] * 2
+    assert all(STATIC_INSTRUCTIONS not in call["contents"] for call in client.calls)
+
+
+def test_persona_cache_refused_falls_back_to_inline_prompt(client, monkeypatch):
+    async def refuse(model, config=None):
+        raise RuntimeError("content too small to cache")
+
+    monkeypatch.setattr(client.aio.caches, "create", refuse)
+
+    async def scenario():
+        cache = PersonaCache(enabled=True)
+        monkeypatch.setattr(llm_agent, "persona_cache", cache)
+        session = conversation("refused", 1)
+        reply = await llm_generate("stall", session.messages, session=session)
+        return cache, reply
+
+    cache, reply = asyncio.run(scenario())
+
+    assert not cache.enabled
+    assert reply == STUB_REPLIES[0]
+    assert STATIC_INSTRUCTIONS in client.calls[0]["contents"]
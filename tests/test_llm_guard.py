@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from core.llm_guard import LLMGuard, UpstreamUnavailable
+
+
+def open_breaker(guard):
+    guard.breaker.state = "open"
+    guard.breaker._opened_at = 0.0
+
+
+def test_cancelled_half_open_probe_frees_the_slot():
+    async def scenario():
+        guard = LLMGuard(timeout=5)
+        open_breaker(guard)
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        probe = asyncio.ensure_future(guard.run(hang))
+        await started.wait()
+        assert guard.breaker.state == "half_open"
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        async def answer():
+            return "ok"
+
+        # The next call is let through as the probe and closes the breaker.
+        assert await guard.run(answer) == "ok"
+        assert guard.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_half_open_allows_only_one_probe():
+    async def scenario():
+        guard = LLMGuard(timeout=5)
+        open_breaker(guard)
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return "ok"
+
+        probe = asyncio.ensure_future(guard.run(slow))
+        await asyncio.sleep(0)
+        with pytest.raises(UpstreamUnavailable):
+            await guard.run(slow)
+        release.set()
+        assert await probe == "ok"
+        assert guard.breaker.state == "closed"
+
+    asyncio.run(scenario())
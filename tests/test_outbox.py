@@ -0,0 +1,35 @@
+import threading
+import time
+
+from tools.outbox import CallbackOutbox
+
+
+class Accepted:
+    status_code = 200
+
+
+def test_stop_while_worker_is_dispatching(tmp_path, monkeypatch):
+    errors = []
+    monkeypatch.setattr(threading, "excepthook", errors.append)
+    outbox = CallbackOutbox("http://callback.test", path=str(tmp_path / "outbox.db"))
+    posted = threading.Event()
+    outbox._http.post = lambda *args, **kwargs: posted.set() or Accepted()
+    outbox._db.execute(
+        "INSERT INTO outbox (session_id, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+        ("s1", '{"sessionId": "s1"}', 0, 0),
+    )
+
+    # Hold the worker inside _dispatch_due so stop() returns before it does.
+    outbox._db_lock.acquire()
+    outbox.start()
+    worker = outbox._worker
+    time.sleep(0.05)
+    outbox.stop(timeout=0.05)
+    assert worker.is_alive()
+    outbox._db_lock.release()
+
+    worker.join(2)
+    assert not worker.is_alive()
+    assert posted.wait(2)
+    assert errors == []
+    assert outbox._worker is None
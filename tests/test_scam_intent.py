@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from core.scam_intent import ScamIntentDetector
+
+
+MESSAGES = [
+    "Your account is blocked urgently verify",
+    "Send money to UPI: fraudster@upi",
+    "Payment link is http://fakebank.xyz/pay",
+    "Call me at +919876543210",
+    "hi, are we still meeting for lunch tomorrow?",
+    "Dear customer, your KYC has expired. Update now to avoid suspension.",
+    "Ok sir I will check and revert",
+    "URGENT: your SBI account 12345678901 will be suspended, share the OTP sent to you",
+    "",
+]
+
+
+@pytest.fixture(scope="module")
+def detector():
+    detector = ScamIntentDetector()
+    if not detector.models_loaded or detector._booster is None:
+        pytest.skip("scam models not loaded or XGBoost fast path unavailable")
+    return detector
+
+
+def test_inplace_predict_matches_predict_proba(detector):
+    matrix = detector.vectorizer.transform(MESSAGES)
+    expected = detector.classifier.predict_proba(matrix)[:, 1]
+    actual = np.array(detector._booster_scores(matrix))
+    assert np.abs(expected - actual).max() <= 1e-6
+
+
+def test_single_row_fast_path_matches_batch(detector):
+    batch = detector._score(MESSAGES)
+    assert [detector._score([text])[0] for text in MESSAGES] == pytest.approx(batch, abs=1e-6)
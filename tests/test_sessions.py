@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+from core.sessions import SqliteSessionStore
+
+
+def test_sqlite_store_waits_off_the_event_loop(tmp_path):
+    store = SqliteSessionStore(path=str(tmp_path / "sessions.db"))
+
+    async def scenario():
+        session = await store.get_session_async("s1")
+        session.add_message("assistant", "your account is blocked")
+
+        # Another thread holds the database, as a busy worker would.
+        store._lock.acquire()
+        save = asyncio.ensure_future(store.save_async(session))
+        ticks = 0
+        while ticks < 5:
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert not save.done()
+        store._lock.release()
+        return await save
+
+    saved = asyncio.run(scenario())
+    assert saved.version == 1
+    assert store.get("s1").messages.total == 1
+
+
+def test_sqlite_store_merges_a_concurrent_turn(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    first, second = SqliteSessionStore(path=path), SqliteSessionStore(path=path)
+    written_on = []
+    write = first._write
+
+    def record(*args):
+        written_on.append(threading.current_thread())
+        return write(*args)
+
+    first._write = record
+
+    async def scenario():
+        mine = await first.get_session_async("s1")
+        theirs = await second.get_session_async("s1")
+        theirs.add_message("assistant", "send the otp")
+        await second.save_async(theirs)
+        mine.add_message("assistant", "pay to x@upi")
+        return await first.save_async(mine)
+
+    stored = asyncio.run(scenario())
+    assert threading.main_thread() not in written_on
+    assert len(written_on) == 2
+    assert stored.version == 2
+    assert list(second.get("s1").messages) == list(stored.messages)
+    assert stored.messages.total == 2
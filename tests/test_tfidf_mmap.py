@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sklearn")
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from core.tfidf_mmap import DEFAULT_VECTORIZER_PATH, MmapTfidfVectorizer, _load_pickled, export
+
+
+CORPUS = [
+    "Your account is blocked urgently verify your KYC",
+    "Send money to UPI: fraudster@upi and share the OTP",
+    "Payment link is http://fakebank.xyz/pay, click now",
+    "Call me at +919876543210 for the refund",
+    "hi, are we still meeting for lunch tomorrow?",
+    "Dear customer, your KYC has expired. Update now to avoid suspension.",
+]
+TEXTS = CORPUS[:3] + [
+    "unseen words only",
+    "",
+    "Ünïcödé account blocked blocked blocked",
+    "share share the the otp otp otp link",
+]
+
+
+def assert_same_output(vectorizer, path, texts=TEXTS):
+    expected = vectorizer.transform(texts)
+    actual = MmapTfidfVectorizer(path).transform(texts)
+    assert actual.shape == expected.shape
+    assert actual.dtype == expected.dtype
+    expected.sort_indices()
+    assert np.array_equal(actual.indptr, expected.indptr)
+    assert np.array_equal(actual.indices, expected.indices)
+    assert np.abs(actual.data - expected.data).max(initial=0.0) <= 1e-12
+
+
+@pytest.mark.parametrize("params", [
+    {},
+    {"ngram_range": (1, 2), "sublinear_tf": True, "stop_words": ["the", "and"]},
+    {"analyzer": "char_wb", "ngram_range": (2, 4), "norm": "l1"},
+    {"binary": True, "use_idf": False, "lowercase": False},
+])
+def test_export_matches_sklearn_transform(tmp_path, params):
+    vectorizer = TfidfVectorizer(**params).fit(CORPUS)
+    path = str(tmp_path / "tfidf.mmap")
+    export(vectorizer, path)
+    assert_same_output(vectorizer, path)
+
+
+def test_float32_idf_stays_close(tmp_path):
+    vectorizer = TfidfVectorizer(ngram_range=(1, 2)).fit(CORPUS)
+    path = str(tmp_path / "tfidf.mmap")
+    export(vectorizer, path, idf_dtype="float32")
+    expected = vectorizer.transform(TEXTS).toarray()
+    actual = MmapTfidfVectorizer(path).transform(TEXTS).toarray()
+    assert np.allclose(actual, expected, rtol=1e-6, atol=1e-7)
+
+
+@pytest.mark.skipif(not os.path.exists(DEFAULT_VECTORIZER_PATH), reason="no shipped vectorizer")
+def test_export_of_the_shipped_vectorizer(tmp_path):
+    vectorizer = _load_pickled(DEFAULT_VECTORIZER_PATH)
+    path = str(tmp_path / "tfidf.mmap")
+    export(vectorizer, path)
+    assert_same_output(vectorizer, path)
@@ -0,0 +1,284 @@
+"""Score and mine archived transcripts in bulk with the API's own logic.
+
+Run from the repository root:
+
+    python -m tools.analyze_corpus transcripts.csv --output results.jsonl
+    python -m tools.analyze_corpus dump.jsonl.gz --text-column message --id-column id \\
+        --output results.parquet --workers 8
+
+The input is CSV or JSON lines, optionally compressed. The format comes
+from the file extension and can be overridden with --format. It is read
+in chunks of --chunk-size rows, CSV by pandas and JSON lines by the json
+module, so ids stay exact. Each chunk goes to a process pool:
+
+- Each worker loads the scam models once.
+- It scores the whole chunk in one batched ScamIntentDetector.classify
+  call and runs the extractor on every row.
+- It encodes its own output rows, so the parent only reads and writes.
+
+At most two chunks per worker are in flight. Results are written in input
+order as they complete, so memory stays bounded however large the input.
+Progress goes to stderr every --report-every seconds.
+
+Each output row has the following fields:
+- id, only with --id-column
+- text, only with --keep-text
+- probability and isScam
+- the five indicator lists of extract_all
+
+Parquet output needs pyarrow.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+from core.extractor import extract_all
+
+
+INDICATOR_KEYS = ("bankAccounts", "upiIds", "phishingLinks", "phoneNumbers", "suspiciousKeywords")
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "jsonl"}
+COMPRESSION_SUFFIXES = (".gz", ".bz2", ".xz", ".zst", ".zip")
+
+
+def detect_format(path):
+    root, ext = os.path.splitext(path.lower())
+    if ext in COMPRESSION_SUFFIXES:
+        ext = os.path.splitext(root)[1]
+    if ext not in FORMATS:
+        raise SystemExit(f"Cannot tell the format of {path}; pass --format csv or --format jsonl")
+    return FORMATS[ext]
+
+
+def open_text(path):
+    """Open a possibly compressed text file, picking the codec from the suffix."""
+    lower = path.lower()
+    if lower.endswith(".gz"):
+        import gzip
+        return gzip.open(path, "rt", encoding="utf-8")
+    if lower.endswith(".bz2"):
+        import bz2
+        return bz2.open(path, "rt", encoding="utf-8")
+    if lower.endswith(".xz"):
+        import lzma
+        return lzma.open(path, "rt", encoding="utf-8")
+    if lower.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise SystemExit("Reading .zst input needs zstandard: pip install zstandard")
+        return zstandard.open(path, "rt", encoding="utf-8")
+    if lower.endswith(".zip"):
+        import io
+        import zipfile
+        archive = zipfile.ZipFile(path)
+        names = archive.namelist()
+        if len(names) != 1:
+            raise SystemExit(f"{path} must hold exactly one file, not {len(names)}")
+        return io.TextIOWrapper(archive.open(names[0]), encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def read_jsonl_chunks(path, text_column, id_column, chunk_size):
+    # json.loads rather than pandas: an id column with a null in it would
+    # go through float64 there, and ids above 2**53 would come back wrong.
+    with open_text(path) as f:
+        lines = (line for line in f if line.strip())
+        while True:
+            rows = [json.loads(line) for line in islice(lines, chunk_size)]
+            if not rows:
+                return
+            for column in [text_column] + ([id_column] if id_column else []):
+                if not any(column in row for row in rows):
+                    raise SystemExit(f"{path} has no column {column!r}; columns are {list(rows[0])}")
+            texts = ["" if row.get(text_column) is None else str(row[text_column]) for row in rows]
+            ids = [row.get(id_column) for row in rows] if id_column else None
+            yield ids, texts
+
+
+def read_chunks(path, fmt, text_column, id_column, chunk_size):
+    """Yield ``(ids, texts)`` lists of up to ``chunk_size`` rows."""
+    if fmt == "jsonl":
+        yield from read_jsonl_chunks(path, text_column, id_column, chunk_size)
+        return
+
+    import pandas as pd
+
+    columns = [text_column] + ([id_column] if id_column else [])
+    with pd.read_csv(path, chunksize=chunk_size, usecols=columns, dtype=str, keep_default_na=False) as reader:
+        for frame in reader:
+            texts = frame[text_column].tolist()
+            ids = frame[id_column].tolist() if id_column else None
+            yield ids, texts
+
+
+# Worker side.
+
+def init_worker():
+    # One process per core already; a multi-threaded booster in every
+    # worker would only oversubscribe the CPUs.
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    from core.scam_intent import get_detector
+    get_detector()
+
+
+def analyze_chunk(ids, texts, threshold, keep_text, output_format):
+    """Classify and extract one chunk; returns encoded JSON lines or a column dict."""
+    from core.scam_intent import get_detector
+
+    scored = get_detector().classify(texts, threshold)
+    columns = {"probability": [], "isScam": []}
+    if ids is not None:
+        columns["id"] = ids
+    if keep_text:
+        columns["text"] = texts
+    for key in INDICATOR_KEYS:
+        columns[key] = []
+
+    for text, (probability, is_scam) in zip(texts, scored):
+        columns["probability"].append(probability)
+        columns["isScam"].append(is_scam)
+        extracted = extract_all(text)
+        for key in INDICATOR_KEYS:
+            columns[key].append(extracted[key])
+
+    scams = sum(columns["isScam"])
+    if output_format == "parquet":
+        return len(texts), scams, columns
+
+    names = (["id"] if ids is not None else []) + (["text"] if keep_text else []) \
+        + ["probability", "isScam", *INDICATOR_KEYS]
+    lines = [
+        json.dumps(dict(zip(names, row)), ensure_ascii=False, allow_nan=False, default=str)
+        for row in zip(*(columns[name] for name in names))
+    ]
+    return len(texts), scams, "".join(line + "\n" for line in lines)
+
+
+# Output.
+
+class JsonlWriter:
+    def __init__(self, path):
+        self.file = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+
+    def write(self, encoded):
+        self.file.write(encoded)
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.writer = None
+
+    def schema(self, names):
+        # Fixed types: a first chunk with no links at all must not pin that
+        # column to a list of nulls.
+        pa = self.pa
+        types = {"id": pa.string(), "text": pa.string(), "probability": pa.float64(), "isScam": pa.bool_()}
+        return pa.schema([(name, types.get(name, pa.list_(pa.string()))) for name in names])
+
+    def write(self, columns):
+        if "id" in columns:
+            columns["id"] = [None if value is None else str(value) for value in columns["id"]]
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, self.schema(list(columns)))
+        self.writer.write_table(self.pa.Table.from_pydict(columns, schema=self.writer.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_writer(path):
+    if path.lower().endswith(".parquet"):
+        return "parquet", ParquetWriter(path)
+    return "jsonl", JsonlWriter(path)
+
+
+class Progress:
+    def __init__(self, every):
+        self.every = every
+        self.started = time.perf_counter()
+        self.next_report = self.started + every
+        self.rows = 0
+        self.scams = 0
+
+    def add(self, rows, scams):
+        self.rows += rows
+        self.scams += scams
+        now = time.perf_counter()
+        if self.every and now >= self.next_report:
+            self.next_report = now + self.every
+            self.report("progress")
+
+    def report(self, label):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        print(f"{label}: {self.rows:,} rows, {self.scams:,} scams, {elapsed:.1f} s, "
+              f"{self.rows / elapsed:,.0f} rows/s", file=sys.stderr, flush=True)
+
+
+def run(args):
+    fmt = args.format or detect_format(args.input)
+    output_format, writer = open_writer(args.output)
+    progress = Progress(args.report_every)
+    chunks = read_chunks(args.input, fmt, args.text_column, args.id_column, args.chunk_size)
+
+    try:
+        if args.workers == 0:
+            init_worker()
+            for ids, texts in chunks:
+                rows, scams, result = analyze_chunk(ids, texts, args.threshold, args.keep_text, output_format)
+                writer.write(result)
+                progress.add(rows, scams)
+        else:
+            with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as pool:
+                pending = deque()
+                for ids, texts in chunks:
+                    pending.append(pool.submit(analyze_chunk, ids, texts, args.threshold,
+                                               args.keep_text, output_format))
+                    if len(pending) >= 2 * args.workers:
+                        rows, scams, result = pending.popleft().result()
+                        writer.write(result)
+                        progress.add(rows, scams)
+                while pending:
+                    rows, scams, result = pending.popleft().result()
+                    writer.write(result)
+                    progress.add(rows, scams)
+    finally:
+        writer.close()
+    progress.report("done")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="CSV or JSON-lines file, optionally compressed")
+    parser.add_argument("--output", default="-", help="results file (.jsonl or .parquet); default stdout")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="input format, if not clear from the name")
+    parser.add_argument("--text-column", default="text")
+    parser.add_argument("--id-column", help="column copied to each result row as id")
+    parser.add_argument("--keep-text", action="store_true", help="copy the text into each result row")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--chunk-size", type=int, default=5000, help="rows per chunk handed to a worker")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes; 0 runs everything in this process")
+    parser.add_argument("--report-every", type=float, default=5.0, help="seconds between progress lines")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
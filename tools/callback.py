@@ -1,6 +1,13 @@
-import requests
-import time
+import asyncio
+import threading
 
+from core import metrics
+from core.log import get_logger
+from core.sessions import sessions
+from tools.outbox import OUTBOX_TIMEOUT, CallbackOutbox
+
+
+log = get_logger("callback")
 
 GUVI_CALLBACK_URL = "https://hackathon.guvi.in/api/updateHoneyPotFinalResult"
 
@@ -35,24 +42,18 @@ def generate_agent_notes(session) -> str:
         notes.append(f"Used urgency tactics: {keywords}")
     
     # Analyze message patterns
-    if len(session.messages) > 0:
-        scammer_msgs = [msg["content"] for msg in session.messages if msg["role"] == "assistant"]
-        if scammer_msgs:
-            avg_length = sum(len(msg.split()) for msg in scammer_msgs) / len(scammer_msgs)
-            if avg_length > 20:
-                notes.append("Verbose messaging style - detailed social engineering")
-            elif avg_length < 5:
-                notes.append("Brief messages - aggressive/impatient approach")
+    if session.scammer_messages > 0:
+        avg_length = session.scammer_words / session.scammer_messages
+        if avg_length > 20:
+            notes.append("Verbose messaging style - detailed social engineering")
+        elif avg_length < 5:
+            notes.append("Brief messages - aggressive/impatient approach")
     
     return "; ".join(notes) if notes else "Scammer interaction detected and logged"
 
 
-def send_guvi_callback(session):
-    if not session.session_id:
-        print("ERROR: Cannot send callback - no valid session ID")
-        return
-    
-    payload = {
+def build_callback_payload(session):
+    return {
         "sessionId": session.session_id,
         "scamDetected": True,
         "totalMessagesExchanged": session.turns,
@@ -60,24 +61,109 @@ def send_guvi_callback(session):
         "agentNotes": generate_agent_notes(session)
     }
 
-    for attempt in range(3):  
-        try:
-            response = requests.post(
-                GUVI_CALLBACK_URL,
-                json=payload,
-                timeout=5
-            )
 
-            print("GUVI CALLBACK STATUS:", response.status_code)
-            print("GUVI RESPONSE:", response.text)
+_outbox = None
+_outbox_lock = threading.Lock()
+# The event loop that owns the session store (see bind_event_loop), and
+# deliveries reported before it was bound.
+_loop = None
+_early_deliveries = []
+_loop_lock = threading.Lock()
+
+
+# Delivery updates waiting on the SQLite store; held so they are not collected.
+_updates = set()
+
+
+def _apply_delivered(session_id):
+    if sessions.blocking:
+        task = asyncio.ensure_future(_apply_delivered_async(session_id))
+        _updates.add(task)
+        task.add_done_callback(_updates.discard)
+        return
+    session = sessions.get(session_id)
+    if session is not None:
+        session.callback_sent = True
+        sessions.save(session)
+
+
+async def _apply_delivered_async(session_id):
+    session = await sessions.get_async(session_id)
+    if session is not None:
+        session.callback_sent = True
+        await sessions.save_async(session)
+
 
-            if response.status_code == 200:
-                session.callback_sent = True
-                return 
+def bind_event_loop(loop):
+    """Route delivery updates to ``loop``; call it on startup, before the outbox starts."""
+    global _loop
+    with _loop_lock:
+        _loop = loop
+        early, _early_deliveries[:] = list(_early_deliveries), []
+    for session_id in early:
+        loop.call_soon_threadsafe(_apply_delivered, session_id)
 
-        except Exception as e:
-            print("GUVI CALLBACK ERROR:", str(e))
 
-        time.sleep(2)  
+def _mark_delivered(session_id):
+    # Runs on the outbox worker thread. Sessions, their deltas and the
+    # journal are only touched from the loop, so hand the update over, or
+    # hold it until a loop is bound.
+    with _loop_lock:
+        loop = _loop
+        if loop is None:
+            _early_deliveries.append(session_id)
+            return
+    try:
+        loop.call_soon_threadsafe(_apply_delivered, session_id)
+    except RuntimeError:
+        log.warning("event loop closed, delivery not recorded in the session", session_id=session_id)
+
+
+def get_outbox():
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                outbox = CallbackOutbox(GUVI_CALLBACK_URL)
+                outbox.on_delivered.append(_mark_delivered)
+                _outbox = outbox
+    return _outbox
+
+
+metrics.collect(
+    "honeypot_callbacks_pending", "Callbacks waiting in the outbox for delivery or retry",
+    lambda: {(): _outbox.pending_count()} if _outbox is not None else None, kind="gauge"
+)
+
+
+def _send_direct(session_id, payload):
+    import requests
+
+    try:
+        response = requests.post(GUVI_CALLBACK_URL, json=payload, timeout=OUTBOX_TIMEOUT)
+    except Exception as e:
+        log.error("direct callback failed", session_id=session_id, error=str(e))
+        return
+    if response.status_code != 200:
+        log.error("direct callback rejected", session_id=session_id, status=response.status_code)
+        return
+    log.info("callback delivered directly", session_id=session_id)
+    _mark_delivered(session_id)
+
+
+def send_guvi_callback(session):
+    """Queue the final result for delivery; the outbox worker does the POST."""
+    if not session.session_id:
+        log.error("cannot send callback without a session id")
+        return
 
-    print("GUVI CALLBACK FAILED AFTER RETRIES")
+    payload = build_callback_payload(session)
+    try:
+        get_outbox().enqueue(session.session_id, payload)
+    except Exception:
+        # No usable outbox (e.g. an unwritable CALLBACK_OUTBOX_PATH): one
+        # direct attempt off the event loop beats losing the result.
+        log.exception("could not queue callback, sending it directly", session_id=session.session_id)
+        threading.Thread(target=_send_direct, args=(session.session_id, payload),
+                         name="guvi-callback-direct", daemon=True).start()
+    session.callback_queued = True
@@ -0,0 +1,228 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core import metrics
+from core.log import get_logger
+
+
+# The deployed bundle is read-only (vercel.json), so the default lives in the
+# temp directory. Point CALLBACK_OUTBOX_PATH at a persistent volume where
+# there is one.
+OUTBOX_PATH = os.getenv("CALLBACK_OUTBOX_PATH", os.path.join(tempfile.gettempdir(), "honeypot", "callback_outbox.db"))
+OUTBOX_CONCURRENCY = int(os.getenv("CALLBACK_CONCURRENCY", "4"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("CALLBACK_MAX_ATTEMPTS", "8"))
+OUTBOX_BASE_DELAY = float(os.getenv("CALLBACK_BASE_DELAY", "1.0"))
+OUTBOX_MAX_DELAY = float(os.getenv("CALLBACK_MAX_DELAY", "300"))
+OUTBOX_TIMEOUT = float(os.getenv("CALLBACK_TIMEOUT", "5"))
+
+log = get_logger("outbox")
+
+CALLBACKS = metrics.counter(
+    "honeypot_callbacks_total", "Final-result callbacks by event: queued, delivered, retry or dead", ("event",)
+)
+CALLBACK_POST_SECONDS = metrics.histogram(
+    "honeypot_callback_post_seconds", "Seconds per callback POST attempt, by whether it was delivered", ("delivered",)
+)
+
+
+class CallbackOutbox:
+    """Durable queue of final-result payloads, drained by a background worker.
+
+    Payloads are committed to SQLite before the request returns, so they
+    survive a process restart. A single worker thread picks up due rows and
+    posts them through one pooled keep-alive session, with at most
+    ``concurrency`` posts in flight and exponential backoff with jitter
+    between attempts.
+    """
+
+    def __init__(self, url, path=OUTBOX_PATH, concurrency=OUTBOX_CONCURRENCY,
+                 max_attempts=OUTBOX_MAX_ATTEMPTS, base_delay=OUTBOX_BASE_DELAY,
+                 max_delay=OUTBOX_MAX_DELAY, timeout=OUTBOX_TIMEOUT):
+        self.url = url
+        self.path = path
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.on_delivered = []
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                created_at REAL NOT NULL
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)")
+        self._db_lock = threading.Lock()
+
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self._http.mount("https://", adapter)
+        self._http.mount("http://", adapter)
+
+        self._in_flight = set()
+        self._wakeup = threading.Event()
+        self._stopping = None
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, session_id, payload):
+        now = time.time()
+        with self._db_lock:
+            self._db.execute(
+                "INSERT INTO outbox (session_id, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+                (session_id, json.dumps(payload, separators=(",", ":")), now, now),
+            )
+        CALLBACKS.inc(event="queued")
+        self.start()
+        self._wakeup.set()
+
+    def pending_count(self):
+        with self._db_lock:
+            row = self._db.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()
+        return row[0]
+
+    def start(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is not None:
+                return
+            # Each worker owns its stop flag and pool, so a worker that outlives
+            # stop()'s join timeout can never submit to a pool that was shut down
+            # or be revived by a later start().
+            self._stopping = threading.Event()
+            executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="guvi-callback")
+            self._worker = threading.Thread(
+                target=self._run, args=(self._stopping, executor), name="guvi-outbox", daemon=True,
+            )
+            self._worker.start()
+
+    def stop(self, timeout=5.0):
+        with self._start_lock:
+            worker, stopping = self._worker, self._stopping
+            self._worker = None
+        if worker is None:
+            return
+        stopping.set()
+        self._wakeup.set()
+        worker.join(timeout)
+
+    def _run(self, stopping, executor):
+        try:
+            while not stopping.is_set():
+                self._wakeup.clear()
+                wait = self._dispatch_due(executor)
+                self._wakeup.wait(wait)
+        finally:
+            executor.shutdown(wait=False)
+
+    def _dispatch_due(self, executor):
+        """Submit due rows to the pool and return seconds until the next one is due."""
+        free = self.concurrency - len(self._in_flight)
+        now = time.time()
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT id, payload, attempts FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (now, free + len(self._in_flight)),
+            ).fetchall()
+            upcoming = self._db.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending' AND next_attempt_at > ?",
+                (now,),
+            ).fetchone()[0]
+
+        for row_id, payload, attempts in rows:
+            if free <= 0:
+                break
+            if row_id in self._in_flight:
+                continue
+            self._in_flight.add(row_id)
+            free -= 1
+            executor.submit(self._deliver, row_id, payload, attempts)
+
+        if free <= 0:
+            # Pool is saturated; a finishing post will wake us up.
+            return None
+        if upcoming is None:
+            return None
+        return max(0.0, upcoming - now)
+
+    def _deliver(self, row_id, payload, attempts):
+        try:
+            delivered = False
+            start = time.perf_counter()
+            try:
+                response = self._http.post(
+                    self.url,
+                    data=payload.encode("utf-8"),
+                    headers={"Content-Type": "application/json"},
+                    timeout=self.timeout,
+                )
+                delivered = response.status_code == 200
+                if not delivered:
+                    log.warning("callback rejected", row_id=row_id, status=response.status_code)
+            except Exception as e:
+                log.warning("callback failed", row_id=row_id, attempt=attempts + 1, error=str(e))
+            CALLBACK_POST_SECONDS.observe(time.perf_counter() - start, delivered=str(delivered).lower())
+
+            if delivered:
+                self._finish(row_id, payload)
+            else:
+                self._reschedule(row_id, attempts + 1)
+        finally:
+            self._in_flight.discard(row_id)
+            self._wakeup.set()
+
+    def _finish(self, row_id, payload):
+        with self._db_lock:
+            self._db.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+        CALLBACKS.inc(event="delivered")
+        session_id = json.loads(payload).get("sessionId")
+        log.info("callback delivered", session_id=session_id, row_id=row_id)
+        for hook in self.on_delivered:
+            try:
+                hook(session_id)
+            except Exception:
+                log.exception("callback delivered hook failed", session_id=session_id)
+
+    def _reschedule(self, row_id, attempts):
+        if attempts >= self.max_attempts:
+            with self._db_lock:
+                self._db.execute(
+                    "UPDATE outbox SET status = 'dead', attempts = ? WHERE id = ?", (attempts, row_id)
+                )
+            log.error("callback dead-lettered", row_id=row_id, attempts=attempts)
+            CALLBACKS.inc(event="dead")
+            return
+
+        CALLBACKS.inc(event="retry")
+
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        delay = random.uniform(delay / 2, delay)
+        with self._db_lock:
+            self._db.execute(
+                "UPDATE outbox SET attempts = ?, next_attempt_at = ? WHERE id = ?",
+                (attempts, time.time() + delay, row_id),
+            )